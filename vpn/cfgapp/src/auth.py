@@ -1,13 +1,27 @@
 """Authentication module for CFG application."""
 
 import hashlib
-from urllib.parse import parse_qs
+import hmac
+from functools import lru_cache
 
 from fastapi import HTTPException, Request
 
 from .config import settings
 
 
+@lru_cache(maxsize=4096)
+def _hash_matches(username: str, hash_param: str, salt: str) -> bool:
+    """Check a client hash against sha256(username + '.' + salt).
+
+    Memoized so repeat requests from the same user skip hashing; the salt is
+    part of the key, so rotating it naturally invalidates old entries.
+    """
+    # Only the exact lowercase hexdigest matches; compare in constant time.
+    # Encoded first, as compare_digest rejects non-ASCII str arguments.
+    expected_hash = hashlib.sha256(f"{username}.{salt}".encode()).hexdigest()
+    return hmac.compare_digest(expected_hash.encode(), hash_param.encode())
+
+
 def verify_auth(request: Request, proxy_config=None) -> bool:
     """Verify authentication using query parameters u and hash.
 
@@ -21,10 +35,11 @@ def verify_auth(request: Request, proxy_config=None) -> bool:
     Raises:
         HTTPException: If authentication fails
     """
-    query_params = parse_qs(request.url.query)
-
-    username = query_params.get("u", [None])[0]
-    hash_param = query_params.get("hash", [None])[0]
+    # Starlette has already parsed the query string; as with parse_qs, blank
+    # values are skipped and the first remaining value wins
+    query_params = request.query_params
+    username = next((v for v in query_params.getlist("u") if v), None)
+    hash_param = next((v for v in query_params.getlist("hash") if v), None)
 
     if not username or not hash_param:
         return False
@@ -35,13 +50,7 @@ def verify_auth(request: Request, proxy_config=None) -> bool:
         if username not in users:
             return False
 
-    # Calculate expected hash: sha256(username + '.' + salt)
-    expected_hash = hashlib.sha256(f"{username}.{settings.salt}".encode()).hexdigest()
-
-    if hash_param != expected_hash:
-        return False
-
-    return True
+    return _hash_matches(username, hash_param, settings.salt)
 
 
 def require_auth(request: Request, proxy_config=None) -> None:
@@ -0,0 +1,51 @@
+"""Small in-process caches used on the request path."""
+
+import time
+from collections.abc import Hashable
+from typing import Any
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire a fixed time after insertion.
+
+    Expired entries are dropped lazily on lookup and when the cache is full;
+    if it is still full after that, the oldest insertion is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """Initialize cache.
+
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Lifetime of an entry in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing/expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key for the configured TTL."""
+        now = time.monotonic()
+        self._data.pop(key, None)
+        if len(self._data) >= self.maxsize:
+            self._data = {k: v for k, v in self._data.items() if v[0] > now}
+            if len(self._data) >= self.maxsize:
+                del self._data[next(iter(self._data))]
+        self._data[key] = (now + self.ttl, value)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,15 +1,68 @@
 """CLASH YAML configuration processor."""
 
+import asyncio
+import copy
+import hashlib
 import logging
+import re
+from collections import OrderedDict
 from typing import Any
 
 import yaml
 
 from .processor import TemplateProcessor
 from .proxy_config import ProxyConfig
+from .utils import extract_query_params
 
 logger = logging.getLogger(__name__)
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper, SafeLoader
+
+    logger.warning(
+        "libyaml bindings not available, CLASH YAML will use the slow pure-Python path"
+    )
+
+_PLACEHOLDER_KEYS = frozenset(("sub", "hash", "u"))
+
+# Block-style placeholder lines that can be spliced textually
+PROXY_CONFIGS_LINE_RE = re.compile(r"^([ \t]*)- PROXY_CONFIGS[ \t]*$", re.MULTILINE)
+PROXY_LIST_LINE_RE = re.compile(r"^([ \t]*)- PROXY_LIST[ \t]*$", re.MULTILINE)
+
+# Parsed templates keyed by content digest; the raw template rarely changes
+# between requests, only the per-user placeholders do.
+_YAML_CACHE_SIZE = 32
+_yaml_cache: OrderedDict[bytes, Any] = OrderedDict()
+
+
+def _load_cached_yaml(yaml_content: str) -> Any:
+    """Return the shared parsed tree for a template (must not be mutated)."""
+    digest = hashlib.blake2b(yaml_content.encode(), digest_size=16).digest()
+    parsed = _yaml_cache.get(digest)
+    if parsed is None:
+        parsed = yaml.load(yaml_content, Loader=SafeLoader)
+        _yaml_cache[digest] = parsed
+        if len(_yaml_cache) > _YAML_CACHE_SIZE:
+            _yaml_cache.popitem(last=False)
+    else:
+        _yaml_cache.move_to_end(digest)
+    return parsed
+
+
+def _dump_block(items: list[Any], indent: str) -> str:
+    """Dump a list as block-style YAML lines indented under its parent key."""
+    dumped = yaml.dump(
+        items,
+        Dumper=SafeDumper,
+        default_flow_style=False,
+        allow_unicode=True,
+        sort_keys=False,
+    )
+    return "\n".join(indent + line for line in dumped.rstrip("\n").split("\n"))
+
 
 class ClashProcessor:
     """Processor for CLASH YAML configurations."""
@@ -35,9 +88,11 @@ class ClashProcessor:
             yaml_content: Raw YAML content as string
 
         Returns:
-            Parsed YAML as dictionary
+            Parsed YAML as dictionary (a private copy the caller may mutate)
         """
-        return yaml.safe_load(yaml_content)
+        # Placeholder replacement mutates the result, so never hand out the
+        # cached tree itself
+        return copy.deepcopy(_load_cached_yaml(yaml_content))
 
     def extract_rule_sets(self, clash_config: dict[str, Any]) -> list[dict[str, Any]]:
         """Extract RULE-SET entries from CLASH configuration.
@@ -50,23 +105,29 @@ class ClashProcessor:
         """
         rule_sets = []
 
-        # Look for RULE-SET entries in rules section
+        # Look for RULE-SET entries in rules section; rules are nearly always
+        # plain strings, so an exact type check plus prefix slice is enough
         rules = clash_config.get("rules", [])
-        for i, rule in enumerate(rules):
-            if isinstance(rule, str) and rule.startswith("RULE-SET,"):
-                # Parse RULE-SET entry
-                parts = rule.split(",", 2)
-                if len(parts) >= 3:
-                    url = parts[1].strip()
-                    proxy_group = parts[2].strip()
-                    rule_sets.append(
-                        {
-                            "index": i,
-                            "url": url,
-                            "proxy_group": proxy_group,
-                            "original_rule": rule,
-                        }
-                    )
+        rule_indices = [
+            i
+            for i, rule in enumerate(rules)
+            if type(rule) is str and rule[:9] == "RULE-SET,"
+        ]
+        for i in rule_indices:
+            rule = rules[i]
+            # Parse RULE-SET entry
+            parts = rule.split(",", 2)
+            if len(parts) >= 3:
+                url = parts[1].strip()
+                proxy_group = parts[2].strip()
+                rule_sets.append(
+                    {
+                        "index": i,
+                        "url": url,
+                        "proxy_group": proxy_group,
+                        "original_rule": rule,
+                    }
+                )
 
         return rule_sets
 
@@ -83,21 +144,21 @@ class ClashProcessor:
         Returns:
             List of expanded rules for each RULE-SET (list of lists)
         """
-        expanded_rules_list = []
-
-        for rule_set in rule_sets:
-            url = rule_set["url"]
-            proxy_group = rule_set["proxy_group"]
-
-            # Create a temporary template with just this RULE-SET
-            temp_template = f"RULE-SET,{url},{proxy_group}"
-
-            # Use template processor to expand it
-            expanded = await self.template_processor.process_template(
-                temp_template, incoming_host, request_headers
-            )
+        # Each RULE-SET expands as its own one-line template, all in parallel
+        expanded_list = await asyncio.gather(
+            *[
+                self.template_processor.process_template(
+                    f"RULE-SET,{rule_set['url']},{rule_set['proxy_group']}",
+                    incoming_host,
+                    request_headers,
+                )
+                for rule_set in rule_sets
+            ]
+        )
 
-            # Add expanded rules (skip the first line which is the comment)
+        # Add expanded rules (skip the first line which is the comment)
+        expanded_rules_list = []
+        for expanded in expanded_list:
             lines = expanded.split("\n")
             if lines and lines[0].startswith("# RULE-SET"):
                 expanded_rules_list.append(lines[1:])
@@ -106,18 +167,122 @@ class ClashProcessor:
 
         return expanded_rules_list
 
+    def _extract_query_params(
+        self, request_headers: dict
+    ) -> tuple[str | None, str | None, str | None]:
+        """Extract sub, hash and user from the forwarded query string.
+
+        Args:
+            request_headers: Request headers carrying ``x-query-string``
+
+        Returns:
+            Tuple of (sub_name, password, user), each None when absent
+        """
+        query_params = extract_query_params(
+            request_headers.get("x-query-string", ""), _PLACEHOLDER_KEYS
+        )
+        sub_name = query_params.get("sub")
+        password = query_params.get("hash")
+        user = query_params.get("u")
+        if sub_name:
+            logger.info(f"Using subscription: {sub_name}")
+        if password:
+            logger.info("Using password from hash parameter")
+        if user:
+            logger.info(f"Using user: {user}")
+        return sub_name, password, user
+
+    def splice_proxy_placeholders(
+        self, yaml_content: str, request_headers: dict
+    ) -> str | None:
+        """Substitute placeholders directly in the template text.
+
+        Handles the common case of a template without RULE-SET entries whose
+        placeholders are plain block-list lines, avoiding a full YAML re-emit.
+
+        Args:
+            yaml_content: Raw YAML content
+            request_headers: Request headers to extract query parameters
+
+        Returns:
+            Processed YAML content, or None if the template needs the full
+            parse/dump path
+        """
+        if not self.proxy_config or "RULE-SET," in yaml_content:
+            return None
+
+        clash_config = _load_cached_yaml(yaml_content)
+        if not isinstance(clash_config, dict):
+            return None
+
+        # Every textual occurrence must be a spliceable line that the
+        # structural replacement would also have replaced
+        configs_lines = PROXY_CONFIGS_LINE_RE.findall(yaml_content)
+        list_lines = PROXY_LIST_LINE_RE.findall(yaml_content)
+        has_configs = clash_config.get("proxies") == ["PROXY_CONFIGS"]
+        list_groups = sum(
+            1
+            for group in clash_config.get("proxy-groups") or []
+            if isinstance(group, dict) and group.get("proxies") == ["PROXY_LIST"]
+        )
+        if (
+            len(configs_lines) != yaml_content.count("PROXY_CONFIGS")
+            or len(configs_lines) != int(has_configs)
+            or len(list_lines) != yaml_content.count("PROXY_LIST")
+            or len(list_lines) != list_groups
+        ):
+            return None
+
+        if not configs_lines and not list_lines:
+            return yaml_content
+
+        sub_name, password, user = self._extract_query_params(request_headers)
+
+        if configs_lines:
+            proxy_configs = self.proxy_config.get_cached_proxy_configs(
+                sub_name, password, user
+            )
+            if not proxy_configs:
+                return None
+            yaml_content = PROXY_CONFIGS_LINE_RE.sub(
+                lambda m: _dump_block(proxy_configs, m.group(1)), yaml_content
+            )
+            logger.info(
+                f"Replaced PROXY_CONFIGS with {len(proxy_configs)} proxy configurations"
+            )
+
+        if list_lines:
+            proxy_list = self.proxy_config.get_cached_proxy_list(sub_name)
+            if not proxy_list:
+                return None
+            yaml_content = PROXY_LIST_LINE_RE.sub(
+                lambda m: _dump_block(proxy_list, m.group(1)), yaml_content
+            )
+            logger.info(f"Replaced PROXY_LIST with {len(proxy_list)} proxy names")
+
+        return yaml_content
+
     def replace_proxy_placeholders(
-        self, clash_config: dict[str, Any], request_headers: dict
+        self,
+        clash_config: dict[str, Any],
+        request_headers: dict,
+        has_proxy_configs: bool = True,
+        has_proxy_list: bool = True,
     ) -> dict[str, Any]:
         """Replace PROXY_CONFIGS and PROXY_LIST placeholders with actual data.
 
         Args:
             clash_config: Parsed CLASH configuration
             request_headers: Request headers to extract query parameters
+            has_proxy_configs: Whether the raw template mentions PROXY_CONFIGS
+            has_proxy_list: Whether the raw template mentions PROXY_LIST
 
         Returns:
             Updated CLASH configuration with replaced placeholders
         """
+        if not has_proxy_configs and not has_proxy_list:
+            return clash_config
+
         if not self.proxy_config:
             logger.warning(
                 "No proxy config available, skipping proxy placeholder replacement"
@@ -125,35 +290,17 @@ class ClashProcessor:
             return clash_config
 
         try:
-            # Extract sub parameter, hash, and user from headers (if available)
-            sub_name = None
-            password = None
-            user = None
-            if "x-query-string" in request_headers:
-                # Parse query string to find 'sub', 'hash', and 'u' parameters
-                import urllib.parse
-
-                query_string = request_headers["x-query-string"]
-                query_params = urllib.parse.parse_qs(query_string)
-                if "sub" in query_params:
-                    sub_name = query_params["sub"][0]
-                    logger.info(f"Using subscription: {sub_name}")
-                if "hash" in query_params:
-                    password = query_params["hash"][0]
-                    logger.info("Using password from hash parameter")
-                if "u" in query_params:
-                    user = query_params["u"][0]
-                    logger.info(f"Using user: {user}")
+            sub_name, password, user = self._extract_query_params(request_headers)
 
             # Replace PROXY_CONFIGS in proxies section
-            if "proxies" in clash_config:
+            if has_proxy_configs and "proxies" in clash_config:
                 proxies = clash_config["proxies"]
                 if (
                     isinstance(proxies, list)
                     and len(proxies) == 1
                     and proxies[0] == "PROXY_CONFIGS"
                 ):
-                    proxy_configs = self.proxy_config.generate_proxy_configs(
+                    proxy_configs = self.proxy_config.get_cached_proxy_configs(
                         sub_name, password, user
                     )
                     clash_config["proxies"] = proxy_configs
@@ -162,7 +309,7 @@ class ClashProcessor:
                     )
 
             # Replace PROXY_LIST in proxy-groups section
-            if "proxy-groups" in clash_config:
+            if has_proxy_list and "proxy-groups" in clash_config:
                 for group in clash_config["proxy-groups"]:
                     if isinstance(group, dict) and "proxies" in group:
                         proxies = group["proxies"]
@@ -171,8 +318,8 @@ class ClashProcessor:
                             and len(proxies) == 1
                             and proxies[0] == "PROXY_LIST"
                         ):
-                            proxy_list = self.proxy_config.get_proxy_list(
-                                sub_name, password
+                            proxy_list = self.proxy_config.get_cached_proxy_list(
+                                sub_name
                             )
                             group["proxies"] = proxy_list
                             logger.info(
@@ -186,7 +333,7 @@ class ClashProcessor:
 
     async def process_clash_config(
         self, yaml_content: str, incoming_host: str, request_headers: dict
-    ) -> str:
+    ) -> bytes:
         """Process CLASH YAML configuration and expand RULE-SET entries.
 
         Args:
@@ -195,44 +342,69 @@ class ClashProcessor:
             request_headers: Request headers
 
         Returns:
-            Processed YAML content with expanded RULE-SET entries
+            Processed YAML content with expanded RULE-SET entries, UTF-8 encoded
+            so the response can send it without another encode pass
         """
+        # Placeholder-only templates are substituted without a YAML round-trip
+        spliced = self.splice_proxy_placeholders(yaml_content, request_headers)
+        if spliced is not None:
+            return spliced.encode()
+
         # Parse YAML
         clash_config = self.parse_clash_yaml(yaml_content)
 
-        # Replace proxy placeholders first
-        clash_config = self.replace_proxy_placeholders(clash_config, request_headers)
+        # Replace proxy placeholders first; the raw-text check lets templates
+        # without sentinels skip the traversal and query parsing entirely
+        clash_config = self.replace_proxy_placeholders(
+            clash_config,
+            request_headers,
+            has_proxy_configs="PROXY_CONFIGS" in yaml_content,
+            has_proxy_list="PROXY_LIST" in yaml_content,
+        )
 
         # Extract RULE-SET entries
         rule_sets = self.extract_rule_sets(clash_config)
 
         if not rule_sets:
             # No RULE-SET entries found, return processed content
-            return yaml.dump(clash_config, default_flow_style=False, allow_unicode=True)
+            return yaml.dump(
+                clash_config,
+                Dumper=SafeDumper,
+                default_flow_style=False,
+                allow_unicode=True,
+                sort_keys=False,
+                encoding="utf-8",
+            )
 
         # Expand RULE-SET entries
         expanded_rules_list = await self.expand_rule_sets(
             rule_sets, incoming_host, request_headers
         )
 
-        # Replace RULE-SET entries with expanded rules in order
+        # Splice expanded rules in at the recorded RULE-SET positions; the
+        # untouched runs between them are copied as slices
         rules = clash_config.get("rules", [])
         new_rules = []
-        rule_set_index = 0
-
-        for rule in rules:
-            if isinstance(rule, str) and rule.startswith("RULE-SET,"):
-                # Replace RULE-SET entry with its expanded rules
-                if rule_set_index < len(expanded_rules_list):
-                    new_rules.extend(expanded_rules_list[rule_set_index])
-                    rule_set_index += 1
-            else:
-                new_rules.append(rule)
+        start = 0
+
+        for rule_set, expanded_rules in zip(
+            rule_sets, expanded_rules_list, strict=True
+        ):
+            index = rule_set["index"]
+            new_rules.extend(rules[start:index])
+            new_rules.extend(expanded_rules)
+            start = index + 1
+        new_rules.extend(rules[start:])
 
         # Update configuration
         clash_config["rules"] = new_rules
 
         # Convert back to YAML
         return yaml.dump(
-            clash_config, default_flow_style=False, allow_unicode=True, sort_keys=False
+            clash_config,
+            Dumper=SafeDumper,
+            default_flow_style=False,
+            allow_unicode=True,
+            sort_keys=False,
+            encoding="utf-8",
         )
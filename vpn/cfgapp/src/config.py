@@ -24,6 +24,9 @@ class Settings(BaseSettings):
     compact_min_prefix_v4: int = Field(default=11)
     compact_min_prefix_v6: int = Field(default=32)
 
+    # Worker processes for expanding large NETSET bodies (0: use a thread)
+    netset_workers: int = Field(default=0)
+
     # Server configuration
     host: str = Field(default="0.0.0.0")
     port: int = Field(default=8000)
@@ -47,6 +50,9 @@ class Settings(BaseSettings):
     # Logging
     log_level: str = Field(default="INFO")
 
+    # Development mode (reload page templates from disk on change)
+    debug: bool = Field(default=False)
+
     model_config = SettingsConfigDict(
         env_file=".env", case_sensitive=False, env_prefix="", extra="ignore"
     )
@@ -1,13 +1,15 @@
 """HAPP template processor: substitutes PROXY_LIST with proxy URLs."""
 
 import logging
-import urllib.parse
 
 from .processor import TemplateProcessor
 from .proxy_config import ProxyConfig
+from .utils import extract_query_params
 
 logger = logging.getLogger(__name__)
 
+_QUERY_KEYS = frozenset(("sub", "hash", "u"))
+
 
 class HappProcessor:
     """Processor for HAPP templates."""
@@ -21,17 +23,10 @@ class HappProcessor:
         self.proxy_config = proxy_config
 
     def _extract_query_params(self, request_headers: dict) -> tuple[str | None, str | None, str | None]:
-        sub_name = password = user = None
-        query_string = request_headers.get("x-query-string")
-        if query_string:
-            params = urllib.parse.parse_qs(query_string)
-            if "sub" in params:
-                sub_name = params["sub"][0]
-            if "hash" in params:
-                password = params["hash"][0]
-            if "u" in params:
-                user = params["u"][0]
-        return sub_name, password, user
+        params = extract_query_params(
+            request_headers.get("x-query-string", ""), _QUERY_KEYS
+        )
+        return params.get("sub"), params.get("hash"), params.get("u")
 
     def replace_proxy_list(self, tpl_text: str, request_headers: dict) -> str:
         """Replace lines that are exactly `PROXY_LIST` with generated proxy URLs."""
@@ -1,22 +1,26 @@
 """Main FastAPI application for CFG proxy processing."""
 
-import json
+import asyncio
+import gzip
 import logging
 from contextlib import asynccontextmanager
 
 import httpx
+import orjson
 import yaml
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
-from fastapi.responses import HTMLResponse, Response
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.templating import Jinja2Templates
+from jinja2 import TemplateNotFound
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from .auth import extract_template_tags, require_auth
+from .cache import TTLCache
 from .clash_processor import ClashProcessor
 from .config import settings
 from .happ_processor import HappProcessor
-from .processor import TemplateProcessor
+from .processor import TemplateProcessor, shutdown_netset_pool
 from .proxy_config import ProxyConfig
 
 # Configure logging
@@ -29,14 +33,44 @@ logger = logging.getLogger(__name__)
 # Global proxy config instance
 proxy_config: ProxyConfig | None = None
 
-# Templates
+# Shared upstream HTTP client (keeps connections and TLS sessions alive)
+http_client: httpx.AsyncClient | None = None
+
+# Paths the origin recently answered 404 for, and rendered templates
+origin_cache = TTLCache(maxsize=2048, ttl=60.0)
+# Larger renders are redone per request, so the cache stays under 128 MiB
+RENDER_CACHE_MAX_BODY = 1024 * 1024
+render_cache = TTLCache(maxsize=128, ttl=60.0)
+# Paths recently served from a template; only these probe .tpl up front
+template_paths = TTLCache(maxsize=1024, ttl=3600.0)
+_origin_inflight: dict[tuple[str, str], asyncio.Future] = {}
+# Requests carrying credentials get per-client origin responses
+_PRIVATE_REQUEST_HEADERS = ("authorization", "proxy-authorization")
+
+# Templates: compiled once and kept in memory unless running in debug mode
 templates = Jinja2Templates(directory="templates")
+templates.env.auto_reload = settings.debug
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream HTTP client, creating it on first use."""
+    global http_client
+
+    if http_client is None:
+        # HTTP/2 lets concurrent RULE-SET/NETSET fetches to one host share
+        # a single connection; servers without it fall back to HTTP/1.1
+        http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return http_client
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown."""
-    global proxy_config
+    global proxy_config, http_client
 
     # Startup
     logger.info("CFG App starting up...")
@@ -63,10 +97,22 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("No proxy config path provided, proxy features disabled")
 
+    # Compile page templates before the first request needs them
+    try:
+        templates.get_template("subscription.html")
+    except TemplateNotFound as e:
+        logger.warning(f"Page template not found: {e}")
+
+    get_http_client()
+
     yield
 
     # Shutdown
     logger.info("CFG App shutting down...")
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    shutdown_netset_pool()
 
 
 app = FastAPI(
@@ -74,6 +120,7 @@ app = FastAPI(
     description="Python application for proxy rule processing and NETSET expansion",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -116,20 +163,44 @@ async def general_exception_handler(request: Request, exc: Exception):
     )
 
 
+# Hop-by-hop headers are connection-specific and forbidden over HTTP/2
+_STRIPPED_HEADERS = frozenset(
+    (
+        b"cookie",
+        b"host",
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"transfer-encoding",
+        b"upgrade",
+        b"te",
+    )
+)
+
+
+def _forward_headers(request: Request) -> list[tuple[bytes, bytes]]:
+    """Return the raw request headers to send upstream.
+
+    Drops cookie, host and hop-by-hop headers.
+    """
+    return [
+        (name, value)
+        for name, value in request.headers.raw
+        if name.lower() not in _STRIPPED_HEADERS
+    ]
+
+
 async def forward_request(request: Request, path_with_search: str) -> httpx.Response:
     """Forward request to origin API."""
     target = f"https://{settings.config_host}{path_with_search}"
     logger.info(f"Forwarding to origin: {target}")
 
-    # Prepare headers
-    headers = dict(request.headers)
-    headers.pop("cookie", None)  # Remove cookies
-    headers.pop("host", None)  # Remove host header
+    headers = _forward_headers(request)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(target, headers=headers, timeout=30.0)
-            return response
+        response = await get_http_client().get(target, headers=headers, timeout=30.0)
+        logger.debug(f"Origin responded over {response.http_version}")
+        return response
     except httpx.ConnectError as e:
         logger.error(f"Connection error to origin: {e}")
         raise HTTPException(status_code=502, detail="Bad Gateway") from e
@@ -144,10 +215,65 @@ async def forward_request(request: Request, path_with_search: str) -> httpx.Resp
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
 
+def _is_cacheable(response: httpx.Response) -> bool:
+    """Check whether an origin response is a miss that may be remembered."""
+    if response.status_code != 404:
+        return False
+    cache_control = response.headers.get("cache-control", "").lower()
+    return not any(d in cache_control for d in ("no-store", "no-cache", "private"))
+
+
+async def cached_forward(request: Request, path_with_search: str) -> httpx.Response:
+    """Forward request to origin, short-circuiting recent 404s for the same path.
+
+    Only the miss itself is remembered: callers never look past the status
+    of a 404, so each hit gets a fresh empty 404 response. Concurrent misses
+    for the same path share a single upstream request; waiters refetch on
+    their own unless it ended in a cacheable 404. Requests with credentials
+    always go to origin on their own.
+    """
+    if any(name in request.headers for name in _PRIVATE_REQUEST_HEADERS):
+        return await forward_request(request, path_with_search)
+
+    key = (path_with_search, request.headers.get("accept-encoding", ""))
+    if origin_cache.get(key):
+        return httpx.Response(status_code=404)
+
+    pending = _origin_inflight.get(key)
+    if pending is not None:
+        response = await asyncio.shield(pending)
+        if _is_cacheable(response):
+            return httpx.Response(status_code=404)
+        return await forward_request(request, path_with_search)
+
+    pending = asyncio.ensure_future(forward_request(request, path_with_search))
+    _origin_inflight[key] = pending
+
+    def _done(task: asyncio.Future) -> None:
+        _origin_inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if _is_cacheable(task.result()):
+            origin_cache.set(key, True)
+
+    pending.add_done_callback(_done)
+
+    return await asyncio.shield(pending)
+
+
+def _discard_task(task: asyncio.Future) -> None:
+    """Cancel a speculative task and swallow whatever it ends with."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+_HEALTH_BODY = orjson.dumps({"status": "healthy", "version": "0.1.0"})
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "version": "0.1.0"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 @app.get("/sr")
@@ -164,7 +290,7 @@ async def shadowrocket_subscription(request: Request):
         require_auth(request, proxy_config)
 
         # Extract subscription and password from query parameters
-        query_params = dict(request.query_params)
+        query_params = request.query_params
         sub_name = query_params.get("sub")
         password = query_params.get("hash")
         user = query_params.get("u")
@@ -201,7 +327,7 @@ async def subscription_page(request: Request):
         require_auth(request, proxy_config)
 
         # Extract subscription and password from query parameters
-        query_params = dict(request.query_params)
+        query_params = request.query_params
         sub_name = query_params.get("sub")
         password = query_params.get("hash")
         user = query_params.get("u")
@@ -240,6 +366,49 @@ async def subscription_page(request: Request):
         raise HTTPException(status_code=500, detail="Internal server error") from e
 
 
+async def render_template(
+    request: Request, tpl_text: str, tags: list[str]
+) -> tuple[bytes, bool]:
+    """Run a fetched template through the processor matching its tags.
+
+    The body is returned UTF-8 encoded so that cached renders are sent
+    without being encoded again on every hit.
+
+    Returns:
+        The rendered body and whether every RULE-SET/NETSET expanded
+    """
+    # Template processor fetches through the shared upstream client
+    template_processor = TemplateProcessor(get_http_client())
+
+    # Prepare headers with query string for proxy config
+    request_headers = dict(request.headers)
+    if request.url.query:
+        request_headers["x-query-string"] = request.url.query
+
+    # Process based on template type
+    if "CLASH" in tags:
+        # Process as CLASH YAML
+        clash_processor = ClashProcessor(template_processor, proxy_config)
+        final_body = await clash_processor.process_clash_config(
+            tpl_text, request.headers.get("host", ""), request_headers
+        )
+    elif "HAPP" in tags:
+        # Process as HAPP template (PROXY_LIST → proxy URLs)
+        happ_processor = HappProcessor(template_processor, proxy_config)
+        final_body = await happ_processor.process_happ_config(
+            tpl_text, request.headers.get("host", ""), request_headers
+        )
+    else:
+        # Process as regular template (SHADOWROCKET or default)
+        final_body = await template_processor.process_template(
+            tpl_text, request.headers.get("host", ""), request_headers
+        )
+
+    if isinstance(final_body, str):
+        final_body = final_body.encode()
+    return final_body, not template_processor.failed
+
+
 @app.get("/{path:path}")
 async def proxy_handler(request: Request, path: str):
     """Main proxy handler that mimics the Cloudflare Worker behavior."""
@@ -247,18 +416,27 @@ async def proxy_handler(request: Request, path: str):
         url = request.url
         path_with_params = url.path + ("?" + url.query if url.query else "")
 
-        query_params = dict(request.query_params)
-        wants_json = str(query_params.get("json", "")).lower() == "true"
+        wants_json = request.query_params.get("json", "").lower() == "true"
 
         logger.info(f"Incoming: {url}")
 
+        # Known template paths probe the template alongside the origin so
+        # they don't pay for two sequential round trips. Other paths wait
+        # for the origin 404, as the probe would double their origin traffic.
+        tpl_path = url.path + ".tpl" + ("?" + url.query if url.query else "")
+        tpl_task = None
+        if template_paths.get(url.path):
+            tpl_task = asyncio.ensure_future(cached_forward(request, tpl_path))
+
         # First, try to forward the request to origin
         try:
-            response = await forward_request(request, path_with_params)
+            response = await cached_forward(request, path_with_params)
             logger.info(f"Origin status: {response.status_code}")
 
             # If not 404, return the response as-is
             if response.status_code != 404:
+                if tpl_task is not None:
+                    _discard_task(tpl_task)
                 # Clean up headers to avoid Content-Length conflicts
                 clean_headers = {}
                 for key, value in response.headers.items():
@@ -271,8 +449,6 @@ async def proxy_handler(request: Request, path: str):
                     "content-encoding" in response.headers
                     and "gzip" in response.headers.get("content-encoding", "")
                 ):
-                    import gzip
-
                     try:
                         # Check if content actually starts with gzip magic bytes
                         if response.content.startswith(b"\x1f\x8b"):
@@ -298,7 +474,9 @@ async def proxy_handler(request: Request, path: str):
                     if isinstance(parsed_yaml, dict | list):
                         clean_headers["content-type"] = "application/json"
                         return Response(
-                            content=json.dumps(parsed_yaml),
+                            content=orjson.dumps(
+                                parsed_yaml, option=orjson.OPT_NON_STR_KEYS
+                            ),
                             status_code=response.status_code,
                             headers=clean_headers,
                             media_type="application/json",
@@ -310,6 +488,8 @@ async def proxy_handler(request: Request, path: str):
                     headers=clean_headers,
                 )
         except Exception as e:
+            if tpl_task is not None:
+                _discard_task(tpl_task)
             logger.error(f"Forward request failed: {e}")
             return Response(
                 content="Internal Server Error",
@@ -317,12 +497,14 @@ async def proxy_handler(request: Request, path: str):
                 headers={"content-type": "text/plain; charset=utf-8"},
             )
 
-        # If we get here, origin returned 404, try template
-        tpl_path = url.path + ".tpl" + ("?" + url.query if url.query else "")
+        # If we get here, origin returned 404, use the template
         logger.info(f"Origin returned 404 for {url.path}, trying template: {tpl_path}")
 
         try:
-            tpl_response = await forward_request(request, tpl_path)
+            if tpl_task is None:
+                tpl_response = await cached_forward(request, tpl_path)
+            else:
+                tpl_response = await tpl_task
             if not tpl_response.is_success:
                 logger.info(
                     f"Template not found for path: {url.path} (status: {tpl_response.status_code})"
@@ -342,6 +524,8 @@ async def proxy_handler(request: Request, path: str):
                 headers={"content-type": "text/plain; charset=utf-8"},
             )
 
+        template_paths.set(url.path, True)
+
         # Process template
         tpl_text = tpl_response.text
 
@@ -353,55 +537,35 @@ async def proxy_handler(request: Request, path: str):
         if "AUTH" in tags:
             require_auth(request, proxy_config)
 
-        # Create HTTP client for template processor
-        async with httpx.AsyncClient() as http_client:
-            # Create template processor
-            template_processor = TemplateProcessor(http_client)
-
-            # Prepare headers with query string for proxy config
-            request_headers = dict(request.headers)
-            if url.query:
-                request_headers["x-query-string"] = url.query
-
-            # Process based on template type
-            if "CLASH" in tags:
-                # Process as CLASH YAML
-                clash_processor = ClashProcessor(template_processor, proxy_config)
-                final_body = await clash_processor.process_clash_config(
-                    tpl_text, request.headers.get("host", ""), request_headers
-                )
-            elif "HAPP" in tags:
-                # Process as HAPP template (PROXY_LIST → proxy URLs)
-                happ_processor = HappProcessor(template_processor, proxy_config)
-                final_body = await happ_processor.process_happ_config(
-                    tpl_text, request.headers.get("host", ""), request_headers
-                )
-            else:
-                # Process as regular template (SHADOWROCKET or default)
-                final_body = await template_processor.process_template(
-                    tpl_text, request.headers.get("host", ""), request_headers
+        # Recent renders of the same request are reused; auth ran above.
+        # Renders degraded by an upstream failure are not kept.
+        render_key = (request.headers.get("host", ""), path_with_params)
+        final_body = render_cache.get(render_key)
+        if final_body is None:
+            final_body, complete = await render_template(request, tpl_text, tags)
+            if complete and len(final_body) <= RENDER_CACHE_MAX_BODY:
+                render_cache.set(render_key, final_body)
+
+        if wants_json:
+            parsed_yaml = yaml.safe_load(final_body)
+            if isinstance(parsed_yaml, dict | list):
+                return Response(
+                    content=orjson.dumps(parsed_yaml, option=orjson.OPT_NON_STR_KEYS),
+                    status_code=200,
+                    media_type="application/json",
                 )
 
-            if wants_json:
-                parsed_yaml = yaml.safe_load(final_body)
-                if isinstance(parsed_yaml, dict | list):
-                    return Response(
-                        content=json.dumps(parsed_yaml),
-                        status_code=200,
-                        media_type="application/json",
-                    )
-
-            return Response(
-                content=final_body,
-                status_code=200,
-                headers={"content-type": "text/plain; charset=utf-8"},
-            )
+        return Response(
+            content=final_body,
+            status_code=200,
+            headers={"content-type": "text/plain; charset=utf-8"},
+        )
 
     except HTTPException:
         # Re-raise HTTP exceptions (like 401 Authentication required)
         raise
     except Exception as e:
-        logger.error(f"Worker error: {str(e)}")
+        logger.exception("Worker error: %s", e)
         return Response(
             content="Internal Server Error",
             status_code=500,
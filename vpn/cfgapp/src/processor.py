@@ -1,28 +1,111 @@
 """Core processing logic for RULE-SET and NETSET expansion."""
 
 import asyncio
+import functools
+import logging
+import multiprocessing
 import re
-import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+from typing import NamedTuple
 from urllib.parse import urlparse
 
 import httpx
 
+from .cache import TTLCache
 from .config import settings
-from .utils import dedupe_lines, netset_expand
+from .utils import netset_expand
+
+logger = logging.getLogger(__name__)
 
 # Regular expressions for parsing
 RULE_RE = re.compile(
     r"^\s*RULE-SET\s*,\s*([^,\s]+)\s*,\s*([^#]+?)\s*(?:#.*)?$", re.IGNORECASE
 )
 NETSET_RE = re.compile(r"^#NETSET\s+(\S+)", re.IGNORECASE)
+POLICY_SUFFIXES = (",proxy", ",direct", ",reject")
+
+# Raw NETSET bodies shared across renders; expansion is redone per suffix.
+# Larger bodies are refetched, so the cache stays under 128 MiB.
+NETSET_CACHE_MAX_BODY = 512 * 1024
+netset_body_cache = TTLCache(maxsize=256, ttl=300.0)
+# Larger NETSET bodies are expanded off the event loop
+NETSET_INLINE_MAX = 16 * 1024
+
+# Optional process pool for those expansions, created on first use when
+# settings.netset_workers is positive; threads share the GIL with the loop
+_netset_pool: ProcessPoolExecutor | None = None
+
+
+def get_netset_pool() -> ProcessPoolExecutor | None:
+    """Return the NETSET expansion process pool, or None if disabled."""
+    global _netset_pool
+
+    if settings.netset_workers <= 0:
+        return None
+    if _netset_pool is None:
+        # Spawned workers do not inherit the event loop or its threads
+        _netset_pool = ProcessPoolExecutor(
+            max_workers=settings.netset_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _netset_pool
+
+
+def shutdown_netset_pool() -> None:
+    """Stop the NETSET expansion process pool if it was started."""
+    global _netset_pool
+
+    if _netset_pool is not None:
+        _netset_pool.shutdown(cancel_futures=True)
+        _netset_pool = None
+
+
+class RuleSetTask(NamedTuple):
+    """A RULE-SET line of a template to be expanded."""
+
+    index: int  # Line number in the template
+    url: str
+    suffix: str  # Policy part with leading comma, e.g. ",PROXY,no-resolve"
+
+
+def _normalize_rule(line: str, suffix: str) -> str | None:
+    """Normalize a stripped rule line and apply the RULE-SET suffix.
+
+    Drops trailing comments, removes whitespace around commas and replaces
+    a trailing PROXY/DIRECT/REJECT policy (case-insensitive) with suffix.
+
+    Returns:
+        The rewritten rule, or None if nothing is left after the comment
+    """
+    line = line.partition("#")[0].rstrip()
+    if not line:
+        return None
+    if ", " in line or " ," in line or "\t" in line:
+        line = ",".join(part.strip() for part in line.split(","))
+    lowered = line.lower()
+    for policy in POLICY_SUFFIXES:
+        if lowered.endswith(policy):
+            return line[: -len(policy)] + suffix
+    return line + suffix
 
 
 class TemplateProcessor:
     """Process template files and expand RULE-SET entries."""
 
     def __init__(self, http_client: httpx.AsyncClient):
-        """Initialize processor with HTTP client."""
+        """Initialize processor with HTTP client.
+
+        Fetched lists are memoized per instance by URL, so a processor should
+        live for a single render; concurrent requests for the same URL share
+        one download. ``failed`` is set once any list could not be fetched or
+        expanded, i.e. the output carries error comments instead of rules.
+        """
         self.http_client = http_client
+        self.failed = False
+        self._fetch_cache: dict[str, asyncio.Future[str]] = {}
+        self._netset_cache: dict[str, asyncio.Future[str | list[str]]] = {}
 
     async def smart_fetch(
         self, url_str: str, incoming_host: str, request_headers: dict
@@ -35,146 +118,205 @@ class TemplateProcessor:
             path = parsed_url.path + (
                 "?" + parsed_url.query if parsed_url.query else ""
             )
-            proxy_url = f"https://{settings.api_host}{path}"
+            fetch_url = f"https://{settings.api_host}{path}"
             print(f"Same host detected; proxy via origin for: {path}")
 
             headers = dict(request_headers)
             headers.pop("cookie", None)  # Remove cookies
-
-            response = await self.http_client.get(proxy_url, headers=headers)
-            response.raise_for_status()
-            return response.text
         else:
             # Direct fetch for external URLs (including ALT_HOST)
+            fetch_url = url_str
             print(f"Direct fetch for: {url_str}")
+            headers = None
+
+        fetch = self._fetch_cache.get(fetch_url)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_text(fetch_url, headers))
+            self._fetch_cache[fetch_url] = fetch
+        return await fetch
+
+    async def _fetch_text(self, url_str: str, headers: dict | None) -> str:
+        """GET url_str and return the body, raising on HTTP errors."""
+        if headers is None:
             response = await self.http_client.get(url_str)
-            response.raise_for_status()
-            return response.text
+        else:
+            response = await self.http_client.get(url_str, headers=headers)
+        response.raise_for_status()
+        return response.text
+
+    async def fetch_netset(self, url_str: str) -> str | list[str]:
+        """Fetch a NETSET file body, sharing downloads of the same URL.
+
+        Returns:
+            The raw body text, or a one-line error comment list on failure
+        """
+        fetch = self._netset_cache.get(url_str)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_netset(url_str))
+            self._netset_cache[url_str] = fetch
+        return await fetch
+
+    async def _fetch_netset(self, url_str: str) -> str | list[str]:
+        """Download a NETSET file body, reusing recent successful downloads."""
+        body = netset_body_cache.get(url_str)
+        if body is not None:
+            return body
 
-    async def expand_netset(self, url_str: str, suffix: str) -> list[str]:
-        """Fetch and expand NETSET file."""
         print(f"Fetching NETSET: {url_str}")
         try:
             response = await self.http_client.get(url_str)
             if not response.is_success:
                 print(f"NETSET fetch failed: {response.status_code}")
                 return [f"# NETSET fetch failed: {url_str} ({response.status_code})"]
-
-            text = response.text
-            expanded = netset_expand(
-                text,
-                suffix,
-                ipv4_block_prefix=settings.ipv4_block_prefix,
-                ipv6_block_prefix=settings.ipv6_block_prefix,
-                enable_compaction=settings.enable_compaction,
-                compact_target_max=settings.compact_target_max,
-                compact_min_prefix_v4=settings.compact_min_prefix_v4,
-                compact_min_prefix_v6=settings.compact_min_prefix_v6,
-            )
-            compaction_info = (
-                f" [compacted to ~{settings.compact_target_max}]"
-                if settings.enable_compaction
-                else ""
-            )
-            print(
-                f"NETSET expanded {len(expanded)} entries (IPv4→/{settings.ipv4_block_prefix}, IPv6→/{settings.ipv6_block_prefix}){compaction_info}"
-            )
-            return expanded
-
+            body = response.text
+            if len(body) <= NETSET_CACHE_MAX_BODY:
+                netset_body_cache.set(url_str, body)
+            return body
         except Exception as e:
             print(f"NETSET error {url_str}: {str(e)}")
             return [f"# NETSET error: {url_str}"]
 
+    async def expand_netset_body(
+        self, url_str: str, body: str | list[str], suffix: str
+    ) -> list[str]:
+        """Expand a fetched NETSET body into rules with the given suffix.
+
+        Bodies larger than NETSET_INLINE_MAX are expanded in a worker thread,
+        or in the process pool when settings.netset_workers is set, so the
+        event loop keeps serving other requests meanwhile.
+        """
+        if isinstance(body, list):
+            self.failed = True
+            return body
+        expand = functools.partial(
+            netset_expand,
+            body,
+            suffix,
+            ipv4_block_prefix=settings.ipv4_block_prefix,
+            ipv6_block_prefix=settings.ipv6_block_prefix,
+            enable_compaction=settings.enable_compaction,
+            compact_target_max=settings.compact_target_max,
+            compact_min_prefix_v4=settings.compact_min_prefix_v4,
+            compact_min_prefix_v6=settings.compact_min_prefix_v6,
+        )
+        try:
+            if len(body) > NETSET_INLINE_MAX:
+                pool = get_netset_pool()
+                if pool is not None:
+                    loop = asyncio.get_running_loop()
+                    try:
+                        expanded = await loop.run_in_executor(pool, expand)
+                    except BrokenProcessPool:
+                        # A worker died; start a fresh pool on the next call
+                        logger.exception("NETSET process pool broken: %s", url_str)
+                        if _netset_pool is pool:
+                            shutdown_netset_pool()
+                        expanded = await asyncio.to_thread(expand)
+                else:
+                    expanded = await asyncio.to_thread(expand)
+            else:
+                expanded = expand()
+        except Exception as e:
+            logger.exception("NETSET error %s: %s", url_str, e)
+            self.failed = True
+            return [f"# NETSET error: {url_str}"]
+        compaction_info = (
+            f" [compacted to ~{settings.compact_target_max}]"
+            if settings.enable_compaction
+            else ""
+        )
+        print(
+            f"NETSET expanded {len(expanded)} entries (IPv4→/{settings.ipv4_block_prefix}, IPv6→/{settings.ipv6_block_prefix}){compaction_info}"
+        )
+        return expanded
+
+    async def expand_netset(self, url_str: str, suffix: str) -> list[str]:
+        """Fetch and expand NETSET file."""
+        body = await self.fetch_netset(url_str)
+        return await self.expand_netset_body(url_str, body, suffix)
+
     def parse_template(
         self, template_text: str
-    ) -> tuple[list[dict], list[str | None], int]:
+    ) -> tuple[list[RuleSetTask], list[str | None], int]:
         """Parse template text and extract RULE-SET tasks."""
         lines = template_text.split("\n")
         tasks = []
-        passthrough = [None] * len(lines)
+        passthrough: list[str | None] = list(lines)
 
         for index, raw_line in enumerate(lines):
+            # Only lines starting with "RULE-SET" (any case) can match
+            if raw_line.lstrip()[:1] not in ("R", "r"):
+                continue
             match = RULE_RE.match(raw_line)
             if not match:
-                passthrough[index] = raw_line
                 continue
 
+            passthrough[index] = None
+
             list_url = match.group(1).strip()
             suffix = (
                 f",{match.group(2).strip()}"  # Keep commas e.g. ",PROXY,no-resolve"
             )
-            tasks.append({"index": index, "url": list_url, "suffix": suffix})
+            tasks.append(RuleSetTask(index, list_url, suffix))
 
         return tasks, passthrough, len(lines)
 
     async def expand_rule_set(
-        self, task: dict, incoming_host: str, request_headers: dict
+        self, task: RuleSetTask, incoming_host: str, request_headers: dict
     ) -> list[str]:
-        """Expand a single RULE-SET entry."""
-        url = task["url"]
-        suffix = task["suffix"]
+        """Expand a single RULE-SET entry.
+
+        The result may contain duplicates; process_template removes them.
+        """
+        url = task.url
+        suffix = task.suffix
 
         print(f'Expanding RULE-SET: {url} with suffix "{suffix}"')
 
         try:
             text = await self.smart_fetch(url, incoming_host, request_headers)
-            lines = text.split("\n")
-
-            # Extract NETSET URLs
             netset_urls = []
-            for line in lines:
-                line = line.strip()
-                match = NETSET_RE.match(line)
-                if match:
-                    netset_urls.append(match.group(1))
-
-            # Process regular rules first
             output = [f"# RULE-SET,{url}"]
-            for line in lines:
+            for line in text.splitlines():
                 trimmed = line.strip()
-                if not trimmed or trimmed.startswith("#"):
-                    continue
-
-                # Remove comments
-                hash_pos = trimmed.find("#")
-                if hash_pos != -1:
-                    trimmed = trimmed[:hash_pos].strip()
                 if not trimmed:
                     continue
+                if trimmed.startswith("#"):
+                    # Collect NETSET URLs, skip other comments
+                    if trimmed[1:2] in ("N", "n"):
+                        match = NETSET_RE.match(trimmed)
+                        if match:
+                            netset_urls.append(match.group(1))
+                    continue
 
-                # Normalize commas
-                trimmed = re.sub(r"\s+,", ",", trimmed)
-                trimmed = re.sub(r",\s+", ",", trimmed)
-
-                # Handle proxy/direct/reject suffixes
-                if re.search(r",(PROXY|DIRECT|REJECT)\s*$", trimmed, re.IGNORECASE):
-                    trimmed = re.sub(
-                        r",(PROXY|DIRECT|REJECT)\s*$",
-                        suffix,
-                        trimmed,
-                        flags=re.IGNORECASE,
-                    )
-                else:
-                    trimmed = f"{trimmed}{suffix}"
-
-                output.append(trimmed)
+                rule = _normalize_rule(trimmed, suffix)
+                if rule:
+                    output.append(rule)
 
             # Process NETSET entries if any
             if netset_urls:
                 print(
                     f"Found {len(netset_urls)} NETSET entr{'ies' if len(netset_urls) > 1 else 'y'} in {url}"
                 )
-                jobs = [self.expand_netset(ns_url, suffix) for ns_url in netset_urls]
-                results = await asyncio.gather(*jobs)
-                netset_results = [item for sublist in results for item in sublist]
-                output.extend(netset_results)
-                return dedupe_lines(output)
+                # Bodies are shared per URL; only the expansion is per suffix
+                bodies = await asyncio.gather(
+                    *[self.fetch_netset(ns_url) for ns_url in netset_urls]
+                )
+                # Large bodies expand concurrently in worker threads/processes
+                expanded = await asyncio.gather(
+                    *[
+                        self.expand_netset_body(ns_url, body, suffix)
+                        for ns_url, body in zip(netset_urls, bodies, strict=True)
+                    ]
+                )
+                output.extend(chain.from_iterable(expanded))
 
-            return dedupe_lines(output)
+            # Duplicates are dropped once over the whole template
+            return output
 
         except Exception as e:
-            print(f"List fetch failed: {url} -> {str(e)}")
-            traceback.print_exc()
+            logger.exception("List fetch failed: %s -> %s", url, e)
+            self.failed = True
             return [f"# RULE-SET fetch failed: {url}"]
 
     async def process_template(
@@ -197,15 +339,26 @@ class TemplateProcessor:
         )
 
         # Merge results with passthrough lines
-        output = []
-        task_by_index = {task["index"]: expansions[i] for i, task in enumerate(tasks)}
-
-        for i in range(original_line_count):
-            if i in task_by_index:
-                output.extend(task_by_index[i])
-            else:
-                output.append(passthrough[i] or "")
+        expansions_by_line: list[list[str] | None] = [None] * original_line_count
+        for task, expansion in zip(tasks, expansions, strict=True):
+            expansions_by_line[task.index] = expansion
+
+        # Stable de-duplication keyed on the stripped line, as dedupe_lines.
+        # Expanded rules are already stripped and non-empty, so they are
+        # their own keys; only passthrough template lines need stripping.
+        seen: set[str] = set()
+        final_output: list[str] = []
+        for expansion, line in zip(expansions_by_line, passthrough, strict=True):
+            if expansion is not None:
+                for rule in expansion:
+                    if rule not in seen:
+                        seen.add(rule)
+                        final_output.append(rule)
+            elif line:
+                key = line.strip()
+                if key and key not in seen:
+                    seen.add(key)
+                    final_output.append(line)
 
-        final_output = dedupe_lines(output)
         print(f"Template expansion complete. Total lines: {len(final_output)}")
         return "\n".join(final_output)
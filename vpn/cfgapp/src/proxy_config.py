@@ -1,24 +1,309 @@
 """Proxy configuration management and generation."""
 
 import base64
+import hashlib
 import io
-import json
 import logging
+import mmap
 import urllib.parse
+import uuid
+from collections.abc import Callable
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
+import orjson
 import qrcode
 from qrcode.image.pil import PilImage
 
+from .cache import TTLCache
 from .config import settings
 
 logger = logging.getLogger(__name__)
 
+# Expanded PROXY_CONFIGS / PROXY_LIST placeholders are reused for a short time
+PLACEHOLDER_CACHE_TTL = 30.0
+PLACEHOLDER_CACHE_SIZE = 512
+
+# Config files at least this large are memory-mapped instead of read
+CONFIG_MMAP_MIN_SIZE = 64 * 1024
+
+# Constant parts of the generated proxy configs. Builders copy a template and
+# fill the None slots, which keeps key order; nested lists/dicts are created
+# per call so configs never share them with the templates. Password-less
+# configs are built once per subscription (see _static_configs) and shared
+# internally; generate_proxy_configs hands out copies of them.
+_HYSTERIA2_TEMPLATE: dict[str, Any] = {
+    "name": None,
+    "type": "hysteria2",
+    "server": None,
+    "port": None,
+    "password": None,
+    "sni": "i.am.com",
+    "skip-cert-verify": True,
+    "alpn": None,
+    "up": 50,
+    "down": 200,
+    "obfs": "salamander",
+    "obfs-password": None,
+    "fast-open": True,
+    "udp": True,
+}
+
+_VMESS_TEMPLATE: dict[str, Any] = {
+    "name": None,
+    "type": "vmess",
+    "server": None,
+    "port": None,
+    "uuid": None,
+    "alterId": 0,
+    "cipher": "auto",
+    "tls": True,
+    "servername": None,
+    "skip-cert-verify": True,
+    "udp": True,
+}
+
+_VLESS_TEMPLATE: dict[str, Any] = {
+    "name": None,
+    "type": "vless",
+    "server": None,
+    "port": None,
+    "uuid": None,
+    "tls": True,
+    "security": "reality",
+    "reality-opts": None,
+    "flow": "xtls-rprx-vision",
+    "servername": "ok.ru",
+    "network": "tcp",
+    "alpn": None,
+    "client-fingerprint": "chrome",
+    "udp": True,
+}
+
+_VLESS_V2_TEMPLATE: dict[str, Any] = {
+    "name": None,
+    "type": "vless",
+    "server": None,
+    "port": None,
+    "uuid": None,
+    "udp": True,
+    "flow": "xtls-rprx-vision",
+    "network": "tcp",
+    "tls": True,
+    "servername": "www.icloud.com",
+    "client-fingerprint": "chrome",
+    "reality-opts": None,
+}
+
+
+@lru_cache(maxsize=8)
+def _parse_config_file(path: str, mtime_ns: int, size: int) -> dict[str, Any]:
+    """Parse a proxy config file.
+
+    mtime_ns and size are part of the cache key only, so an edited file is
+    parsed again. The returned dict is shared between instances and must
+    not be mutated.
+    """
+    if size < CONFIG_MMAP_MIN_SIZE:
+        return orjson.loads(Path(path).read_bytes())
+    # Large files are parsed straight from the page cache without a copy
+    with (
+        open(path, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        memoryview(mm) as view,
+    ):
+        return orjson.loads(view)
+
+
+def _copy_config(config: dict[str, Any]) -> dict[str, Any]:
+    """Copy a generated config together with its nested lists and dicts."""
+    return {
+        key: value.copy() if isinstance(value, dict | list) else value
+        for key, value in config.items()
+    }
+
+
+def _b64(data: bytes) -> str:
+    """Base64-encode bytes into an ASCII string."""
+    return base64.b64encode(data).decode("ascii")
+
+
+def _config_settings_key() -> tuple:
+    """Return the settings that generated proxy configs depend on."""
+    return (
+        settings.hysteria2_port,
+        settings.hysteria2_v2_port,
+        settings.obfs_password,
+        settings.https_port,
+        settings.reality_public_key,
+        settings.reality_short_id,
+        settings.xray_publickey,
+        settings.xray_verify,
+    )
+
+
+# Per-proxy credentials are pure functions of the proxy name; the set of
+# names is small and static, so each is derived once
+@lru_cache(maxsize=256)
+def _derive_password(proxy_name: str) -> str:
+    """Derive the default password for a proxy."""
+    return hashlib.sha256(proxy_name.encode()).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _derive_port(proxy_name: str) -> int:
+    """Derive a port in 40000-49999 for a proxy."""
+    digest = hashlib.md5(f"{proxy_name}:port".encode()).digest()
+    return 40000 + (int.from_bytes(digest[:4], "big") % 10000)
+
+
+@lru_cache(maxsize=256)
+def _derive_uuid(proxy_name: str) -> str:
+    """Derive the default UUID for a proxy."""
+    digest = hashlib.md5(f"{proxy_name}:uuid".encode()).digest()
+    return str(uuid.UUID(bytes=digest))
+
+
+def _user_uuid(user: str, salt: str) -> str:
+    """Derive a user's VLESS UUID, matching the server-side config."""
+    digest = hashlib.sha256(f"{user}.{salt}".encode()).digest()
+    return str(uuid.UUID(bytes=digest[:16]))
+
+
+# Link query strings only depend on settings-derived values; encode each once
+@lru_cache(maxsize=16)
+def _hysteria2_query(obfs_password: str) -> str:
+    """Return the query string shared by Hysteria2 links."""
+    return urllib.parse.urlencode(
+        {
+            "peer": "i.am.com",
+            "insecure": "1",
+            "alpn": "h3",
+            "obfs": "salamander",
+            "obfs-password": obfs_password,
+            "udp": "1",
+            "fragment": "1,40-60,30-50",
+        }
+    )
+
+
+@lru_cache(maxsize=16)
+def _vless_reality_query(
+    public_key: str,
+    short_id: str,
+    peer: str = "ok.ru",
+    mldsa65_verify: str | None = None,
+) -> str:
+    """Return the ShadowRocket VLESS query that follows the remarks field."""
+    params = {
+        "tls": "1",
+        "peer": peer,
+        "alpn": "h2,http/1.1",
+        "xtls": "2",
+        "pbk": public_key,
+        "sid": short_id,
+    }
+    if mldsa65_verify:
+        params["mldsa65-verify"] = mldsa65_verify
+    return urllib.parse.urlencode(params)
+
+
+@lru_cache(maxsize=16)
+def _vless_happ_query(
+    public_key: str,
+    short_id: str,
+    peer: str = "ok.ru",
+    mldsa65_verify: str | None = None,
+) -> str:
+    """Return the query string of xray-style VLESS Reality links for HAPP."""
+    params = {
+        "type": "tcp",
+        "security": "reality",
+        "encryption": "none",
+        "flow": "xtls-rprx-vision",
+        "sni": peer,
+        "peer": peer,
+        "fp": "chrome",
+        "alpn": "h2,http/1.1",
+        "xudp": "1",
+        "packetEncoding": "xudp",
+        "packet_encoding": "xudp",
+        "pbk": public_key,
+        "sid": short_id,
+    }
+    if mldsa65_verify:
+        params["mldsa65Verify"] = mldsa65_verify
+    return urllib.parse.urlencode(params)
+
+
+@lru_cache(maxsize=1024)
+def _qr_code_b64(data: str) -> str:
+    """Render data as a QR code PNG and return it base64 encoded.
+
+    Subscription URLs repeat across /sub visits, so encoded images are cached.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white", image_factory=PilImage)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return _b64(buffer.getvalue())
+
 
 class ProxyConfig:
     """Proxy configuration manager."""
 
+    # Protocol -> builder called as (self, host, proxy_name, password, user)
+    _PROTOCOL_HANDLERS: dict[str, Callable[..., dict[str, Any]]] = {
+        "hy2": lambda self, host, name, password, user: self._generate_hysteria2_config(
+            host, name, password
+        ),
+        "hy2-v2": lambda self, host, name, password, user: (
+            self._generate_hysteria2_v2_config(host, name, password, user)
+        ),
+        "vmess": lambda self, host, name, password, user: self._generate_vmess_config(
+            host, name
+        ),
+        "vless": lambda self, host, name, password, user: self._generate_vless_config(
+            host, name, user
+        ),
+        "vless-v2": lambda self, host, name, password, user: (
+            self._generate_vless_v2_config(host, name, user)
+        ),
+    }
+
+    # Protocol -> URL builder called as (self, config, user_password, happ)
+    _URL_HANDLERS: dict[str, Callable[..., str]] = {
+        "hy2": lambda self, config, user_password, happ: self._generate_hysteria2_url(
+            config
+        ),
+        "hy2-v2": lambda self, config, user_password, happ: (
+            self._generate_hysteria2_v2_url(config, user_password)
+        ),
+        "vmess": lambda self, config, user_password, happ: self._generate_vmess_url(
+            config
+        ),
+        "vless": lambda self, config, user_password, happ: (
+            self._generate_vless_url_happ(config)
+            if happ
+            else self._generate_vless_url(config)
+        ),
+        "vless-v2": lambda self, config, user_password, happ: (
+            self._generate_vless_v2_url_happ(config)
+            if happ
+            else self._generate_vless_v2_url(config)
+        ),
+    }
+
     def __init__(self, config_path: str):
         """Initialize proxy configuration.
 
@@ -27,6 +312,15 @@ class ProxyConfig:
         """
         self.config_path = Path(config_path)
         self.config_data = self._load_config()
+        self._placeholder_cache = TTLCache(
+            PLACEHOLDER_CACHE_SIZE, PLACEHOLDER_CACHE_TTL
+        )
+        # Without a password or user the configs only depend on the loaded
+        # file and settings, so each subscription is built up front and
+        # rebuilt only when those settings change
+        self._static_configs: dict[str, tuple[tuple, list]] = {}
+        for sub_name in self.get_subs():
+            self._static_tagged_proxy_configs(sub_name)
 
     def _load_config(self) -> dict[str, Any]:
         """Load configuration from file.
@@ -36,18 +330,21 @@ class ProxyConfig:
 
         Raises:
             FileNotFoundError: If config file doesn't exist
-            json.JSONDecodeError: If config file is invalid JSON
+            json.JSONDecodeError: If config file is invalid JSON (raised as
+                orjson.JSONDecodeError, a subclass)
         """
         if not self.config_path.exists():
             raise FileNotFoundError(f"Proxy config file not found: {self.config_path}")
 
         try:
-            with open(self.config_path, encoding="utf-8") as f:
-                config = json.load(f)
-            logger.info(f"Loaded proxy config from {self.config_path}")
+            stat = self.config_path.stat()
+            config = _parse_config_file(
+                str(self.config_path), stat.st_mtime_ns, stat.st_size
+            )
+            logger.info("Loaded proxy config from %s", self.config_path)
             return config
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in proxy config file: {e}")
+        except orjson.JSONDecodeError as e:
+            logger.error("Invalid JSON in proxy config file: %s", e)
             raise
 
     def get_users(self) -> list[str]:
@@ -80,7 +377,7 @@ class ProxyConfig:
             sub_name = "default"
 
         if sub_name not in subs:
-            logger.warning(f"Subscription '{sub_name}' not found, using 'default'")
+            logger.warning("Subscription '%s' not found, using 'default'", sub_name)
             sub_name = "default"
 
         return subs.get(sub_name, {})
@@ -99,9 +396,80 @@ class ProxyConfig:
             user: Username for authentication (optional)
 
         Returns:
-            List of proxy configurations (one per proxy in subscription)
+            List of proxy configurations (one per proxy in subscription),
+            owned by the caller
+        """
+        proxy_configs = [
+            _copy_config(config)
+            for _, config in self._generate_tagged_proxy_configs(
+                sub_name, password, user
+            )
+        ]
+
+        logger.info(
+            "Generated %d proxy configurations for subscription '%s'",
+            len(proxy_configs),
+            sub_name or "default",
+        )
+        return proxy_configs
+
+    def _generate_tagged_proxy_configs(
+        self,
+        sub_name: str | None = None,
+        password: str | None = None,
+        user: str | None = None,
+    ) -> list[tuple[str, dict[str, Any]]]:
+        """Generate proxy configurations paired with their source protocol.
+
+        Args:
+            sub_name: Subscription name, defaults to 'default'
+            password: Password from query parameter (optional)
+            user: Username for authentication (optional)
+
+        Returns:
+            List of (protocol, configuration) pairs, one per valid proxy.
+            Configs built without password and user are shared between calls
+            and must be treated as read-only.
+        """
+        if not password and not user and (sub_name or "default") in self.get_subs():
+            return list(self._static_tagged_proxy_configs(sub_name or "default"))
+        return self._build_tagged_proxy_configs(sub_name, password, user)
+
+    def _static_tagged_proxy_configs(
+        self, sub_name: str
+    ) -> list[tuple[str, dict[str, Any]]]:
+        """Return the shared password-less configs of an existing subscription.
+
+        Args:
+            sub_name: Subscription name present in the config file
+
+        Returns:
+            Cached list of (protocol, configuration) pairs
+        """
+        key = _config_settings_key()
+        entry = self._static_configs.get(sub_name)
+        if entry is None or entry[0] != key:
+            entry = (key, self._build_tagged_proxy_configs(sub_name, None, None))
+            self._static_configs[sub_name] = entry
+        return entry[1]
+
+    def _build_tagged_proxy_configs(
+        self,
+        sub_name: str | None = None,
+        password: str | None = None,
+        user: str | None = None,
+    ) -> list[tuple[str, dict[str, Any]]]:
+        """Build (protocol, configuration) pairs for a subscription.
+
+        Args:
+            sub_name: Subscription name, defaults to 'default'
+            password: Password from query parameter (optional)
+            user: Username for authentication (optional)
+
+        Returns:
+            List of (protocol, configuration) pairs, one per valid proxy
         """
-        proxy_configs = []
+        tagged_configs = []
         subscription_proxies = self.get_subscription_proxies(sub_name)
 
         for proxy_name, proxy_config in subscription_proxies.items():
@@ -109,7 +477,7 @@ class ProxyConfig:
             host = proxy_config.get("host", "")
 
             if not protocol or not host:
-                logger.warning(f"Invalid proxy config: {proxy_name}")
+                logger.warning("Invalid proxy config: %s", proxy_name)
                 continue
 
             # Generate one config per proxy (not per user)
@@ -117,12 +485,9 @@ class ProxyConfig:
                 protocol, host, proxy_name, password, user
             )
             if proxy_config:
-                proxy_configs.append(proxy_config)
+                tagged_configs.append((protocol, proxy_config))
 
-        logger.info(
-            f"Generated {len(proxy_configs)} proxy configurations for subscription '{sub_name or 'default'}'"
-        )
-        return proxy_configs
+        return tagged_configs
 
     def _generate_proxy_config(
         self,
@@ -144,19 +509,11 @@ class ProxyConfig:
         Returns:
             Proxy configuration dictionary
         """
-        if protocol == "hy2":
-            return self._generate_hysteria2_config(host, proxy_name, password)
-        elif protocol == "hy2-v2":
-            return self._generate_hysteria2_v2_config(host, proxy_name, password, user)
-        elif protocol == "vmess":
-            return self._generate_vmess_config(host, proxy_name)
-        elif protocol == "vless":
-            return self._generate_vless_config(host, proxy_name, user)
-        elif protocol == "vless-v2":
-            return self._generate_vless_v2_config(host, proxy_name, user)
-        else:
-            logger.warning(f"Unsupported protocol: {protocol}")
+        handler = self._PROTOCOL_HANDLERS.get(protocol)
+        if handler is None:
+            logger.warning("Unsupported protocol: %s", protocol)
             return {}
+        return handler(self, host, proxy_name, password, user)
 
     def _generate_hysteria2_config(
         self, host: str, proxy_name: str, password: str | None = None
@@ -182,22 +539,14 @@ class ProxyConfig:
 
         port = settings.hysteria2_port  # Use fixed port from environment variable
 
-        return {
-            "name": name,
-            "type": "hysteria2",
-            "server": host,
-            "port": port,
-            "password": proxy_password,
-            "sni": "i.am.com",
-            "skip-cert-verify": True,
-            "alpn": ["h3"],
-            "up": 50,
-            "down": 200,
-            "obfs": "salamander",
-            "obfs-password": settings.obfs_password,
-            "fast-open": True,
-            "udp": True,
-        }
+        config = _HYSTERIA2_TEMPLATE.copy()
+        config["name"] = name
+        config["server"] = host
+        config["port"] = port
+        config["password"] = proxy_password
+        config["alpn"] = ["h3"]
+        config["obfs-password"] = settings.obfs_password
+        return config
 
     def _generate_hysteria2_v2_config(
         self,
@@ -232,22 +581,14 @@ class ProxyConfig:
 
         port = settings.hysteria2_v2_port  # Use v2 port from environment variable
 
-        return {
-            "name": name,
-            "type": "hysteria2",
-            "server": host,
-            "port": port,
-            "password": proxy_password,
-            "sni": "i.am.com",
-            "skip-cert-verify": True,
-            "alpn": ["h3"],
-            "up": 50,
-            "down": 200,
-            "obfs": "salamander",
-            "obfs-password": settings.obfs_password,
-            "fast-open": True,
-            "udp": True,
-        }
+        config = _HYSTERIA2_TEMPLATE.copy()
+        config["name"] = name
+        config["server"] = host
+        config["port"] = port
+        config["password"] = proxy_password
+        config["alpn"] = ["h3"]
+        config["obfs-password"] = settings.obfs_password
+        return config
 
     def _generate_vmess_config(self, host: str, proxy_name: str) -> dict[str, Any]:
         """Generate VMess proxy configuration.
@@ -263,19 +604,13 @@ class ProxyConfig:
         uuid = self._generate_uuid(proxy_name)
         port = self._generate_port(proxy_name)
 
-        return {
-            "name": name,
-            "type": "vmess",
-            "server": host,
-            "port": port,
-            "uuid": uuid,
-            "alterId": 0,
-            "cipher": "auto",
-            "tls": True,
-            "servername": host,
-            "skip-cert-verify": True,
-            "udp": True,
-        }
+        config = _VMESS_TEMPLATE.copy()
+        config["name"] = name
+        config["server"] = host
+        config["port"] = port
+        config["uuid"] = uuid
+        config["servername"] = host
+        return config
 
     def _generate_vless_config(
         self, host: str, proxy_name: str, user: str | None = None
@@ -294,38 +629,23 @@ class ProxyConfig:
 
         # Generate UUID based on user + salt (same as server config)
         if user:
-            import hashlib
-
-            base = f"{user}.{settings.salt}"
-            hash_val = hashlib.sha256(base.encode()).hexdigest()
-            # Convert to UUID format (8-4-4-4-12)
-            uuid = f"{hash_val[:8]}-{hash_val[8:12]}-{hash_val[12:16]}-{hash_val[16:20]}-{hash_val[20:32]}"
+            client_uuid = _user_uuid(user, settings.salt)
         else:
-            uuid = self._generate_uuid(proxy_name)
+            client_uuid = self._generate_uuid(proxy_name)
 
         port = settings.https_port  # Use HTTPS port for client routing
 
-        return {
-            "name": name,
-            "type": "vless",
-            "server": host,
-            "port": port,
-            "uuid": uuid,
-            "tls": True,
-            "security": "reality",
-            "reality-opts": {
-                "public-key": settings.reality_public_key
-                if hasattr(settings, "reality_public_key")
-                else "",
-                "short-id": settings.reality_short_id,
-            },
-            "flow": "xtls-rprx-vision",
-            "servername": "ok.ru",
-            "network": "tcp",
-            "alpn": ["h2", "http/1.1"],
-            "client-fingerprint": "chrome",
-            "udp": True,
+        config = _VLESS_TEMPLATE.copy()
+        config["name"] = name
+        config["server"] = host
+        config["port"] = port
+        config["uuid"] = client_uuid
+        config["reality-opts"] = {
+            "public-key": settings.reality_public_key,
+            "short-id": settings.reality_short_id,
         }
+        config["alpn"] = ["h2", "http/1.1"]
+        return config
 
     def _generate_vless_v2_config(
         self, host: str, proxy_name: str, user: str | None = None
@@ -344,39 +664,27 @@ class ProxyConfig:
 
         # Generate UUID based on user + salt (same as server config)
         if user:
-            import hashlib
-
-            base = f"{user}.{settings.salt}"
-            hash_val = hashlib.sha256(base.encode()).hexdigest()
-            # Convert to UUID format (8-4-4-4-12)
-            uuid = f"{hash_val[:8]}-{hash_val[8:12]}-{hash_val[12:16]}-{hash_val[16:20]}-{hash_val[20:32]}"
+            client_uuid = _user_uuid(user, settings.salt)
         else:
-            uuid = self._generate_uuid(proxy_name)
+            client_uuid = self._generate_uuid(proxy_name)
 
         port = settings.https_port
 
-        return {
-            "name": name,
-            "type": "vless",
-            "server": host,
-            "port": port,
-            "uuid": uuid,
-            "udp": True,
-            "flow": "xtls-rprx-vision",
-            "network": "tcp",
-            "tls": True,
-            "servername": "www.icloud.com",
-            "client-fingerprint": "chrome",
-            "reality-opts": {
-                "allow-insecure": False,
-                "fingerprint": "chrome",
-                "mldsa65-verify": settings.xray_verify,
-                "public-key": settings.xray_publickey,
-                "short-id": "3e3e",
-                "show": False,
-                "spider-x": "/",
-            },
+        config = _VLESS_V2_TEMPLATE.copy()
+        config["name"] = name
+        config["server"] = host
+        config["port"] = port
+        config["uuid"] = client_uuid
+        config["reality-opts"] = {
+            "allow-insecure": False,
+            "fingerprint": "chrome",
+            "mldsa65-verify": settings.xray_verify,
+            "public-key": settings.xray_publickey,
+            "short-id": "3e3e",
+            "show": False,
+            "spider-x": "/",
         }
+        return config
 
     def _generate_password(self, proxy_name: str) -> str:
         """Generate password for proxy.
@@ -387,11 +695,7 @@ class ProxyConfig:
         Returns:
             Generated password
         """
-        # Simple hash-based generation for demo
-        import hashlib
-
-        base = f"{proxy_name}"
-        return hashlib.sha256(base.encode()).hexdigest()
+        return _derive_password(proxy_name)
 
     def _generate_port(self, proxy_name: str) -> int:
         """Generate port for proxy.
@@ -402,12 +706,7 @@ class ProxyConfig:
         Returns:
             Generated port number
         """
-        # Simple hash-based generation for demo
-        import hashlib
-
-        base = f"{proxy_name}:port"
-        hash_val = int(hashlib.md5(base.encode()).hexdigest()[:8], 16)
-        return 40000 + (hash_val % 10000)
+        return _derive_port(proxy_name)
 
     def _generate_uuid(self, proxy_name: str) -> str:
         """Generate UUID for proxy.
@@ -418,14 +717,7 @@ class ProxyConfig:
         Returns:
             Generated UUID
         """
-        import hashlib
-        import uuid
-
-        base = f"{proxy_name}:uuid"
-        hash_val = hashlib.md5(base.encode()).hexdigest()
-
-        # Convert to UUID format
-        return str(uuid.UUID(hash_val))
+        return _derive_uuid(proxy_name)
 
     def get_proxy_list(
         self, sub_name: str | None = None, password: str | None = None
@@ -439,8 +731,59 @@ class ProxyConfig:
         Returns:
             List of proxy names
         """
-        proxy_configs = self.generate_proxy_configs(sub_name, password, None)
-        return [config["name"] for config in proxy_configs]
+        # Names are the subscription keys, so no config needs to be built;
+        # keep exactly the entries generate_proxy_configs would emit
+        return [
+            proxy_name
+            for proxy_name, proxy_config in self.get_subscription_proxies(
+                sub_name
+            ).items()
+            if proxy_config.get("host")
+            and proxy_config.get("protocol") in self._PROTOCOL_HANDLERS
+        ]
+
+    def _cached_placeholder(self, key: tuple, factory: Callable[[], list]) -> list:
+        """Return a TTL-cached placeholder expansion, building it on a miss.
+
+        Args:
+            key: Cache key, must include every input of the expansion
+            factory: Callable producing the expansion
+
+        Returns:
+            Fresh list holding the cached entries
+        """
+        entries = self._placeholder_cache.get(key)
+        if entries is None:
+            entries = factory()
+            self._placeholder_cache.set(key, entries)
+        # A new list per call so two placeholders never share one object
+        return list(entries)
+
+    def get_cached_proxy_configs(
+        self,
+        sub_name: str | None = None,
+        password: str | None = None,
+        user: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Cached variant of generate_proxy_configs for placeholder expansion.
+
+        The password is part of the key because it is embedded in the
+        generated configs. Entries must be treated as read-only.
+        """
+        return self._cached_placeholder(
+            ("configs", sub_name, password, user),
+            lambda: self.generate_proxy_configs(sub_name, password, user),
+        )
+
+    def get_cached_proxy_list(self, sub_name: str | None = None) -> list[str]:
+        """Cached variant of get_proxy_list for placeholder expansion.
+
+        Proxy names do not depend on the password, so one entry serves every
+        user of a subscription.
+        """
+        return self._cached_placeholder(
+            ("list", sub_name), lambda: self.get_proxy_list(sub_name)
+        )
 
     def get_proxy_urls(
         self,
@@ -455,39 +798,15 @@ class ProxyConfig:
             - "shadowrocket" (default): Shadowrocket-compatible URLs
             - "happ": standard xray-style URLs for HAPP clients
         """
-        proxy_configs = self.generate_proxy_configs(sub_name, password, user)
+        tagged_configs = self._generate_tagged_proxy_configs(sub_name, password, user)
+        user_password = f"{user}:{password}" if user and password else password
+        happ = flavor == "happ"
         urls = []
 
-        for config in proxy_configs:
-            protocol = config.get("type", "")
-            if protocol == "hysteria2":
-                if config.get("port") == settings.hysteria2_v2_port:
-                    user_password = (
-                        f"{user}:{password}" if user and password else password
-                    )
-                    url = self._generate_hysteria2_v2_url(config, user_password)
-                else:
-                    url = self._generate_hysteria2_url(config)
-            elif protocol == "vmess":
-                url = self._generate_vmess_url(config)
-            elif protocol == "vless":
-                is_v2 = "mldsa65-verify" in config.get("reality-opts", {})
-                if flavor == "happ":
-                    url = (
-                        self._generate_vless_v2_url_happ(config)
-                        if is_v2
-                        else self._generate_vless_url_happ(config)
-                    )
-                else:
-                    url = (
-                        self._generate_vless_v2_url(config)
-                        if is_v2
-                        else self._generate_vless_url(config)
-                    )
-            else:
-                logger.warning(f"Unsupported protocol: {protocol}")
-                continue
-
+        # Dispatch on the subscription protocol instead of re-deriving it
+        # from the generated config
+        for protocol, config in tagged_configs:
+            url = self._URL_HANDLERS[protocol](self, config, user_password, happ)
             if url:
                 urls.append(url)
 
@@ -510,8 +829,7 @@ class ProxyConfig:
             Base64 encoded subscription URLs
         """
         urls = self.get_proxy_urls(sub_name, password, user)
-        subscription_content = "\n".join(urls)
-        return base64.b64encode(subscription_content.encode()).decode()
+        return _b64("\n".join(urls).encode())
 
     def _generate_hysteria2_url(self, config: dict[str, Any]) -> str:
         """Generate Hysteria2 URL for ShadowRocket.
@@ -527,18 +845,7 @@ class ProxyConfig:
         port = config["port"]
         name = config["name"]
 
-        # Build query parameters
-        params = {
-            "peer": "i.am.com",
-            "insecure": "1",
-            "alpn": "h3",
-            "obfs": "salamander",
-            "obfs-password": config["obfs-password"],
-            "udp": "1",
-            "fragment": "1,40-60,30-50",
-        }
-
-        query_string = urllib.parse.urlencode(params)
+        query_string = _hysteria2_query(config["obfs-password"])
         return f"hysteria2://{password}@{server}:{port}?{query_string}#{name}"
 
     def _generate_hysteria2_v2_url(
@@ -566,18 +873,7 @@ class ProxyConfig:
             # Fallback to regular password
             auth_password = password
 
-        # Build query parameters
-        params = {
-            "peer": "i.am.com",
-            "insecure": "1",
-            "alpn": "h3",
-            "obfs": "salamander",
-            "obfs-password": config["obfs-password"],
-            "udp": "1",
-            "fragment": "1,40-60,30-50",
-        }
-
-        query_string = urllib.parse.urlencode(params)
+        query_string = _hysteria2_query(config["obfs-password"])
         return f"hysteria2://{auth_password}@{server}:{port}?{query_string}#{name}"
 
     def _generate_vmess_url(self, config: dict[str, Any]) -> str:
@@ -605,9 +901,8 @@ class ProxyConfig:
             "fragment": "1,40-60,30-50",
         }
 
-        # Encode to base64
-        config_json = json.dumps(vmess_config, separators=(",", ":"))
-        config_b64 = base64.b64encode(config_json.encode()).decode()
+        # Encode to base64 (orjson emits compact UTF-8 JSON)
+        config_b64 = _b64(orjson.dumps(vmess_config))
 
         return f"vmess://{config_b64}?fragment=1,40-60,30-50"
 
@@ -625,21 +920,12 @@ class ProxyConfig:
         port = config["port"]
         name = config["name"]
 
-        # Build query parameters for Reality protocol
-        params = {
-            "remarks": name,
-            "tls": "1",
-            "peer": "ok.ru",
-            "alpn": "h2,http/1.1",
-            "xtls": "2",
-            "pbk": settings.reality_public_key
-            if hasattr(settings, "reality_public_key")
-            else "",
-            "sid": settings.reality_short_id,
-        }
-
-        query_string = urllib.parse.urlencode(params)
-        return f"vless://{uuid}@{server}:{port}?{query_string}"
+        # Only the remarks vary per proxy; the Reality tail is shared
+        remarks = urllib.parse.quote_plus(name)
+        query_string = _vless_reality_query(
+            settings.reality_public_key, settings.reality_short_id
+        )
+        return f"vless://{uuid}@{server}:{port}?remarks={remarks}&{query_string}"
 
     def _generate_vless_v2_url(self, config: dict[str, Any]) -> str:
         """Generate VLESS v2 URL for ShadowRocket.
@@ -659,32 +945,17 @@ class ProxyConfig:
         reality_opts = config.get("reality-opts", {})
         public_key = reality_opts.get(
             "public-key",
-            settings.reality_public_key
-            if hasattr(settings, "reality_public_key")
-            else "",
+            settings.reality_public_key,
         )
         short_id = reality_opts.get("short-id", settings.reality_short_id)
         peer = config.get("servername", "www.icloud.com")
 
-        params = {
-            "remarks": name,
-            "tls": "1",
-            "peer": peer,
-            "alpn": "h2,http/1.1",
-            "xtls": "2",
-            "pbk": public_key,
-            "sid": short_id,
-        }
-
-        # Add mldsa65 verify if present (might be useful depending on shadowrocket updates)
-        mldsa65_verify = reality_opts.get("mldsa65-verify")
-        if mldsa65_verify:
-            # The exact param name depends on Shadowrocket implementation, adding custom pbk etc is usually suffice,
-            # but we can pass it if there is a known parameter or just append the verify key
-            params["mldsa65-verify"] = mldsa65_verify
-
-        query_string = urllib.parse.urlencode(params)
-        return f"vless://{uuid}@{server}:{port}?{query_string}"
+        # The Reality tail only depends on the reality-opts, so it is shared
+        remarks = urllib.parse.quote_plus(name)
+        query_string = _vless_reality_query(
+            public_key, short_id, peer, reality_opts.get("mldsa65-verify")
+        )
+        return f"vless://{uuid}@{server}:{port}?remarks={remarks}&{query_string}"
 
     def _generate_vless_url_happ(self, config: dict[str, Any]) -> str:
         """Generate standard (xray-style) VLESS Reality URL for HAPP."""
@@ -693,29 +964,9 @@ class ProxyConfig:
         port = config["port"]
         name = config["name"]
 
-        public_key = (
-            settings.reality_public_key
-            if hasattr(settings, "reality_public_key")
-            else ""
+        query_string = _vless_happ_query(
+            settings.reality_public_key, settings.reality_short_id
         )
-
-        params = {
-            "type": "tcp",
-            "security": "reality",
-            "encryption": "none",
-            "flow": "xtls-rprx-vision",
-            "sni": "ok.ru",
-            "peer": "ok.ru",
-            "fp": "chrome",
-            "alpn": "h2,http/1.1",
-            "xudp": "1",
-            "packetEncoding": "xudp",
-            "packet_encoding": "xudp",
-            "pbk": public_key,
-            "sid": settings.reality_short_id,
-        }
-
-        query_string = urllib.parse.urlencode(params)
         fragment = urllib.parse.quote(name)
         return f"vless://{uuid}@{server}:{port}?{query_string}#{fragment}"
 
@@ -729,34 +980,14 @@ class ProxyConfig:
         reality_opts = config.get("reality-opts", {})
         public_key = reality_opts.get(
             "public-key",
-            settings.reality_public_key
-            if hasattr(settings, "reality_public_key")
-            else "",
+            settings.reality_public_key,
         )
         short_id = reality_opts.get("short-id", settings.reality_short_id)
         peer = config.get("servername", "www.icloud.com")
 
-        params = {
-            "type": "tcp",
-            "security": "reality",
-            "encryption": "none",
-            "flow": "xtls-rprx-vision",
-            "sni": peer,
-            "peer": peer,
-            "fp": "chrome",
-            "alpn": "h2,http/1.1",
-            "xudp": "1",
-            "packetEncoding": "xudp",
-            "packet_encoding": "xudp",
-            "pbk": public_key,
-            "sid": short_id,
-        }
-
-        mldsa65_verify = reality_opts.get("mldsa65-verify")
-        if mldsa65_verify:
-            params["mldsa65Verify"] = mldsa65_verify
-
-        query_string = urllib.parse.urlencode(params)
+        query_string = _vless_happ_query(
+            public_key, short_id, peer, reality_opts.get("mldsa65-verify")
+        )
         fragment = urllib.parse.quote(name)
         return f"vless://{uuid}@{server}:{port}?{query_string}#{fragment}"
 
@@ -779,7 +1010,6 @@ class ProxyConfig:
             sub:// URL string
         """
         # Build the /sr endpoint URL with parameters
-        sr_url = f"{base_url}/sr"
         params = {"u": user}  # User is required for authentication
 
         if sub_name:
@@ -788,10 +1018,9 @@ class ProxyConfig:
             params["hash"] = password
 
         query_string = urllib.parse.urlencode(params)
-        sr_url = f"{sr_url}?{query_string}"
 
         # Encode the URL to base64
-        sr_url_b64 = base64.b64encode(sr_url.encode()).decode()
+        sr_url_b64 = _b64(f"{base_url}/sr?{query_string}".encode())
 
         # Create sub:// URL with subscription name fragment
         subscription_name = sub_name or "default"
@@ -806,25 +1035,4 @@ class ProxyConfig:
         Returns:
             Base64 encoded PNG image
         """
-        # Create QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-
-        # Create image
-        img = qr.make_image(
-            fill_color="black", back_color="white", image_factory=PilImage
-        )
-
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        img_b64 = base64.b64encode(buffer.getvalue()).decode()
-
-        return img_b64
+        return _qr_code_b64(data)
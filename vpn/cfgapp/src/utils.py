@@ -4,22 +4,162 @@ This module implements the logic from Cloudflare Worker v4 for processing
 RULE-SET templates and expanding NETSET entries with IP aggregation.
 
 It also includes an intelligent network compaction algorithm that reduces
-large lists of CIDR blocks while maintaining full coverage.
+large lists of CIDR blocks while maintaining full coverage, and the query
+string scanner used by the template processors.
 """
 
+import bisect
+import heapq
 import ipaddress
+import itertools
+import logging
 import re
+from functools import lru_cache
 from typing import Optional
+from urllib.parse import unquote_plus
+
+logger = logging.getLogger(__name__)
 
 # Regular expressions for IP validation and parsing
 RE_IPV4_CIDR = re.compile(r"^(?:\d{1,3}\.){3}\d{1,3}\/(?:[0-9]|[12][0-9]|3[0-2])$")
-RE_IPV6_CIDR = re.compile(r"^([0-9a-f:]+:+)+\/\d{1,3}$", re.IGNORECASE)
+RE_IP_PREFIX = re.compile(r"^IP\s+", re.IGNORECASE)
 RULE_RE = re.compile(
     r"^\s*RULE-SET\s*,\s*([^,\s]+)\s*,\s*([^#]+?)\s*(?:#.*)?$", re.IGNORECASE
 )
 NETSET_RE = re.compile(r"^#NETSET\s+(\S+)", re.IGNORECASE)
 
 
+# Many distinct input CIDRs floor to the same parent block, so block strings
+# are shared across span cache entries; at /18 there are only 2**18 of them
+@lru_cache(maxsize=65536)
+def _ipv4_block_str(address: int, prefix: int) -> str:
+    """Format an IPv4 block from its integer address without an IPv4Address."""
+    return (
+        f"{address >> 24}.{(address >> 16) & 0xFF}."
+        f"{(address >> 8) & 0xFF}.{address & 0xFF}/{prefix}"
+    )
+
+
+def _ipv4_blocks(cidr: str, target_prefix: int) -> tuple[str, ...]:
+    """Compute the IPv4 blocks covering cidr, see IPProcessor.ipv4_cover_blocks."""
+    try:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+    except ipaddress.AddressValueError as e:
+        raise ValueError(f"Invalid IPv4 CIDR: {cidr}") from e
+    return _ipv4_span_blocks(
+        int(network.network_address), network.prefixlen, target_prefix
+    )
+
+
+def _build_ipv4_span_blocks(
+    start_addr: int, prefixlen: int, target_prefix: int
+) -> tuple[str, ...]:
+    """Compute the IPv4 blocks covering the network start_addr/prefixlen.
+
+    start_addr must be the network address, i.e. have no host bits set.
+    """
+    # If the original network is already at the target prefix it is
+    # its own cover block
+    if prefixlen == target_prefix:
+        return (_ipv4_block_str(start_addr, target_prefix),)
+
+    # Get the end address of the original network
+    end_addr = start_addr | (0xFFFFFFFF >> prefixlen)
+
+    # Calculate block size for target prefix
+    block_size = 2 ** (32 - target_prefix)
+
+    # Floor the start address to the target prefix
+    # This is equivalent to floorToPrefixV4 in the Cloudflare Worker
+    # Apply mask to get the network address for the target prefix
+    mask = (0xFFFFFFFF << (32 - target_prefix)) & 0xFFFFFFFF
+    cursor = start_addr & mask
+
+    return tuple(
+        _ipv4_block_str(n, target_prefix)
+        for n in range(cursor, end_addr + 1, block_size)
+    )
+
+
+# NETSET sources repeat the same CIDRs across lines and renders; results are
+# tuples so cached entries cannot be mutated by callers. Only spans of up to
+# 2**6 = 64 blocks are cached, so the cache stays small for the life of the
+# worker; wider spans (a /8 at /18 is 1024 blocks) are rebuilt every time.
+_SPAN_CACHE_MAX_BITS = 6
+_cached_ipv4_span_blocks = lru_cache(maxsize=4096)(_build_ipv4_span_blocks)
+
+
+def _ipv4_span_blocks(
+    start_addr: int, prefixlen: int, target_prefix: int
+) -> tuple[str, ...]:
+    """Return the IPv4 blocks covering start_addr/prefixlen, cached if few."""
+    if target_prefix - prefixlen > _SPAN_CACHE_MAX_BITS:
+        return _build_ipv4_span_blocks(start_addr, prefixlen, target_prefix)
+    return _cached_ipv4_span_blocks(start_addr, prefixlen, target_prefix)
+
+
+# Characters of the address part of an IPv6 CIDR line, for str.translate
+_IPV6_ADDRESS_CHARS = str.maketrans("", "", "0123456789abcdefABCDEF:")
+
+
+def _is_ipv6_cidr(line: str) -> bool:
+    """Check line has the shape of an IPv6 CIDR netset entry.
+
+    That is hex digits and colons ending in a colon, then a 1-3 digit
+    prefix. A regex for this shape needs nested quantifiers, which
+    backtrack exponentially on long malformed lines.
+    """
+    address, _, prefix = line.rpartition("/")
+    return (
+        len(address) > 1
+        and address[-1] == ":"
+        and not address.translate(_IPV6_ADDRESS_CHARS)
+        and 0 < len(prefix) < 4
+        and prefix.isdecimal()
+    )
+
+
+def _parse_ipv4(address: str) -> int | None:
+    """Parse a canonical dotted quad into an integer without ipaddress.
+
+    The address must already match the RE_IPV4_CIDR octet shape. Returns
+    None for anything ipaddress would reject (octets above 255, leading
+    zeros, non-ASCII digits), so callers can fall back to it for the error.
+    """
+    if not address.isascii():
+        return None
+    value = 0
+    for octet in address.split("."):
+        if (octet[0] == "0" and len(octet) > 1) or int(octet) > 255:
+            return None
+        value = value << 8 | int(octet)
+    return value
+
+
+@lru_cache(maxsize=4096)
+def _ipv6_blocks(cidr: str, target_prefix: int) -> tuple[str, ...]:
+    """Compute the IPv6 blocks covering cidr, see IPProcessor.ipv6_cidr_to_blocks."""
+    try:
+        network = ipaddress.IPv6Network(cidr, strict=False)
+
+        # If the original network is already at or larger than target prefix
+        if network.prefixlen == target_prefix:
+            return (f"{network.network_address}/{target_prefix}",)
+
+        # Floor the starting address to the target prefix (same as Cloudflare Worker)
+        # Convert to integer, apply mask, convert back
+        addr_int = int(network.network_address)
+        mask = (1 << (128 - target_prefix)) - 1
+        floored_addr_int = addr_int & ~mask
+
+        # The floored address is the network address; format it directly
+        floored_addr = ipaddress.IPv6Address(floored_addr_int)
+        return (f"{floored_addr.compressed}/{target_prefix}",)
+
+    except ipaddress.AddressValueError as e:
+        raise ValueError(f"Invalid IPv6 CIDR: {cidr}") from e
+
+
 class IPProcessor:
     """IP address processor with aggregation capabilities."""
 
@@ -66,42 +206,7 @@ class IPProcessor:
             >>> processor.ipv4_cover_blocks("192.168.1.0/24")
             ['192.168.0.0/18']
         """
-        try:
-            network = ipaddress.IPv4Network(cidr, strict=False)
-
-            # If the original network is already at the target prefix or larger
-            if network.prefixlen == self.ipv4_block_prefix:
-                return [f"{network.network_address}/{self.ipv4_block_prefix}"]
-            elif network.prefixlen > self.ipv4_block_prefix:
-                # Original network is smaller than target, need to aggregate
-                pass
-
-            # Get the start and end addresses of the original network
-            start_addr = int(network.network_address)
-            end_addr = int(network.broadcast_address)
-
-            # Calculate block size for target prefix
-            block_size = 2 ** (32 - self.ipv4_block_prefix)
-
-            # Floor the start address to the target prefix
-            # This is equivalent to floorToPrefixV4 in the Cloudflare Worker
-            # Apply mask to get the network address for the target prefix
-            mask = (0xFFFFFFFF << (32 - self.ipv4_block_prefix)) & 0xFFFFFFFF
-            cursor = start_addr & mask
-
-            blocks = []
-            while cursor <= end_addr:
-                # Convert cursor back to IP address
-                ip_addr = ipaddress.IPv4Address(cursor)
-                blocks.append(f"{ip_addr}/{self.ipv4_block_prefix}")
-
-                # Move to next block
-                cursor = (cursor + block_size) & 0xFFFFFFFF
-
-            return blocks
-
-        except ipaddress.AddressValueError as e:
-            raise ValueError(f"Invalid IPv4 CIDR: {cidr}") from e
+        return list(_ipv4_blocks(cidr, self.ipv4_block_prefix))
 
     def ipv6_cidr_to_blocks(self, cidr: str) -> list[str]:
         """Convert IPv6 CIDR to list of target prefix blocks.
@@ -120,29 +225,7 @@ class IPProcessor:
             >>> processor.ipv6_cidr_to_blocks("2001:db8::/48")
             ['2001:db8::/32']
         """
-        try:
-            network = ipaddress.IPv6Network(cidr, strict=False)
-
-            # If the original network is already at or larger than target prefix
-            if network.prefixlen == self.ipv6_block_prefix:
-                return [f"{network.network_address}/{self.ipv6_block_prefix}"]
-
-            # Floor the starting address to the target prefix (same as Cloudflare Worker)
-            # Convert to integer, apply mask, convert back
-            addr_int = int(network.network_address)
-            mask = (1 << (128 - self.ipv6_block_prefix)) - 1
-            floored_addr_int = addr_int & ~mask
-
-            # Create the floored network
-            floored_addr = ipaddress.IPv6Address(floored_addr_int)
-            floored_network = ipaddress.IPv6Network(
-                f"{floored_addr}/{self.ipv6_block_prefix}", strict=False
-            )
-
-            return [f"{floored_network.network_address}/{self.ipv6_block_prefix}"]
-
-        except ipaddress.AddressValueError as e:
-            raise ValueError(f"Invalid IPv6 CIDR: {cidr}") from e
+        return list(_ipv6_blocks(cidr, self.ipv6_block_prefix))
 
     def netset_expand(self, text: str, suffix: str) -> list[str]:
         """Expand raw .netset text into lines with IP aggregation.
@@ -160,44 +243,64 @@ class IPProcessor:
         Returns:
             List of expanded and deduplicated rules
         """
-        out = []
+        # Insertion-ordered dict dedupes as lines are produced; every line
+        # shares the same prefix and suffix, so exact keys match the
+        # strip-based keys of dedupe_lines
+        out: dict[str, None] = {}
+        target_prefix = self.ipv4_block_prefix
 
-        for raw_line in text.split("\n"):
+        for raw_line in text.splitlines():
             line = raw_line.strip()
             if not line or line.startswith("#") or line.startswith(";"):
                 continue
 
-            # Remove "IP " prefix if present
-            line = re.sub(r"^IP\s+", "", line, flags=re.IGNORECASE)
+            # Remove "IP " prefix if present; most lines start with a digit
+            # or hex group, so skip the regex unless the first letter matches
+            if line[0] in "Ii":
+                line = RE_IP_PREFIX.sub("", line, count=1)
 
-            # Handle IPv6 CIDR
-            if RE_IPV6_CIDR.match(line):
+            # Only IPv6 CIDRs contain a colon, so each line runs one check
+            if ":" in line:
+                if not _is_ipv6_cidr(line):
+                    continue
                 try:
-                    blocks = self.ipv6_cidr_to_blocks(line)
+                    blocks = _ipv6_blocks(line, self.ipv6_block_prefix)
                     for block in blocks:
                         if block.startswith("#"):
-                            out.append(block)
+                            out[block] = None
                         else:
-                            out.append(f"IP-CIDR,{block}{suffix}")
+                            out[f"IP-CIDR,{block}{suffix}"] = None
                 except ValueError as e:
-                    print(f"IPv6 parse error for {line}: {e}")
-                    out.append(f"IP-CIDR,{line}{suffix}")
-                continue
-
-            # Handle IPv4 CIDR
-            if RE_IPV4_CIDR.match(line):
-                blocks4 = self.ipv4_cover_blocks(line)
+                    logger.warning("IPv6 parse error for %s: %s", line, e)
+                    out[f"IP-CIDR,{line}{suffix}"] = None
+            elif RE_IPV4_CIDR.match(line):
+                # The regex has validated the shape, so parse the address
+                # by hand; ipaddress is only needed to reject bad octets
+                address, _, prefix = line.partition("/")
+                start = _parse_ipv4(address)
+                if start is None:
+                    blocks4 = _ipv4_blocks(line, target_prefix)
+                else:
+                    prefixlen = int(prefix)
+                    host_bits = 0xFFFFFFFF >> prefixlen
+                    # Pre-aggregated lists are mostly aligned blocks at the
+                    # target prefix already; those are their own cover
+                    if prefixlen == target_prefix and not start & host_bits:
+                        out[f"IP-CIDR,{line}{suffix}"] = None
+                        continue
+                    blocks4 = _ipv4_span_blocks(
+                        start & ~host_bits, prefixlen, target_prefix
+                    )
                 for block in blocks4:
-                    out.append(f"IP-CIDR,{block}{suffix}")
+                    out[f"IP-CIDR,{block}{suffix}"] = None
 
-        # Deduplicate first
-        out = self.dedupe_lines(out)
+        lines = list(out)
 
         # Apply network compaction if enabled
         if self.enable_compaction:
-            out = self._apply_compaction(out, suffix)
+            lines = self._apply_compaction(lines, suffix)
 
-        return out
+        return lines
 
     def _apply_compaction(self, lines: list[str], suffix: str) -> list[str]:
         """Apply network compaction to IP-CIDR lines.
@@ -217,18 +320,24 @@ class IPProcessor:
         ipv6_cidrs = []
         other_lines = []
 
+        suffix_len = len(suffix)
+
         for line in lines:
             if line.startswith("IP-CIDR,"):
                 # Extract CIDR without prefix and suffix
                 cidr = line[8:]  # Remove "IP-CIDR,"
-                if suffix and cidr.endswith(suffix):
-                    cidr = cidr[: -len(suffix)]
-
-                # Detect IP version
-                if RE_IPV4_CIDR.match(cidr):
+                if suffix_len and cidr.endswith(suffix):
+                    cidr = cidr[:-suffix_len]
+
+                # Detect IP version; only IPv6 CIDRs contain a colon, so a
+                # single check confirms the match
+                if ":" in cidr:
+                    if _is_ipv6_cidr(cidr):
+                        ipv6_cidrs.append(cidr)
+                    else:
+                        other_lines.append(line)
+                elif RE_IPV4_CIDR.match(cidr):
                     ipv4_cidrs.append(cidr)
-                elif RE_IPV6_CIDR.match(cidr):
-                    ipv6_cidrs.append(cidr)
                 else:
                     other_lines.append(line)
             else:
@@ -275,7 +384,9 @@ class IPProcessor:
         seen: set[str] = set()
         out = []
 
-        for line in lines:
+        # Exact repeats (most duplicates) are dropped in C first; first
+        # occurrences keep their order, so the result is unchanged
+        for line in dict.fromkeys(lines):
             key = line.strip()
             if key and key not in seen:
                 seen.add(key)
@@ -312,28 +423,27 @@ class NetworkCompactor:
         is_ipv4 = isinstance(nets[0], ipaddress.IPv4Network)
         max_bits = 32 if is_ipv4 else 128
 
-        # Find address range
-        min_addr = min(int(net.network_address) for net in nets)
-        max_addr = max(int(net.broadcast_address) for net in nets)
-
-        # Find minimal prefix that covers this range
-        for prefix_len in range(min_prefix, max_bits + 1):
-            size = 1 << (max_bits - prefix_len)
-            base = min_addr & ~(size - 1)
-
-            # Check if this network covers all addresses
-            if base + size - 1 >= max_addr:
-                # Create candidate network
-                if is_ipv4:
-                    candidate = ipaddress.IPv4Network((base, prefix_len))
-                else:
-                    candidate = ipaddress.IPv6Network((base, prefix_len))
-
-                # Verify all networks are subnets
-                if all(net.subnet_of(candidate) for net in nets):
-                    return candidate
+        # Find address range in one pass over the networks
+        min_addr = 1 << max_bits
+        max_addr = 0
+        for net in nets:
+            start = int(net.network_address)
+            end = int(net.broadcast_address)
+            if start < min_addr:
+                min_addr = start
+            if end > max_addr:
+                max_addr = end
+
+        # The longest prefix shared by both ends of the range gives the
+        # smallest aligned network covering it, and with it every network
+        prefix_len = max_bits - (min_addr ^ max_addr).bit_length()
+        if prefix_len < min_prefix:
+            return None
 
-        return None
+        base = min_addr >> (max_bits - prefix_len) << (max_bits - prefix_len)
+        if is_ipv4:
+            return ipaddress.IPv4Network((base, prefix_len))
+        return ipaddress.IPv6Network((base, prefix_len))
 
     @staticmethod
     def compact_networks(
@@ -353,6 +463,9 @@ class NetworkCompactor:
             target_max: Target maximum number of networks (approximate)
             min_prefix: Minimum prefix length (maximum network size)
                        For IPv4: 8=/8 (16M IPs), 11=/11 (2M IPs), 12=/12 (1M IPs)
+                       Only limits merges that add addresses; like
+                       ipaddress.collapse_addresses, joining two adjacent
+                       halves can still yield a shorter prefix
             version: IP version (4 or 6)
 
         Returns:
@@ -370,60 +483,98 @@ class NetworkCompactor:
         else:
             nets = [ipaddress.IPv6Network(c) for c in cidrs]
 
-        original_coverage = sum(net.num_addresses for net in nets)
-
         # Basic collapse to remove overlaps
         nets = list(ipaddress.collapse_addresses(nets))
 
         if len(nets) <= target_max:
             return nets
 
-        # Adaptive merging with increasing cost thresholds
+        # Greedy merging of neighbours, cheapest first, up to a cost cap
         # Cost = additional IP addresses added by merging
-        thresholds = [1048576, 2097152, 4194304, 8388608, 16777216]
-
-        for threshold in thresholds:
-            changed = True
-
-            while changed and len(nets) > target_max:
-                changed = False
-
-                # Sort by network address for neighbor detection
-                nets = sorted(nets, key=lambda n: int(n.network_address))
-
-                i = 0
-                while i < len(nets) - 1 and len(nets) > target_max:
-                    net1, net2 = nets[i], nets[i + 1]
-
-                    # Try to find minimal supernet for this pair
-                    supernet = NetworkCompactor.find_minimal_supernet(
-                        [net1, net2], min_prefix
-                    )
-
-                    if supernet:
-                        # Calculate cost (additional IPs)
-                        cost = (
-                            supernet.num_addresses
-                            - net1.num_addresses
-                            - net2.num_addresses
-                        )
-
-                        if cost <= threshold:
-                            # Merge the pair
-                            nets = nets[:i] + [supernet] + nets[i + 2 :]
-                            nets = list(ipaddress.collapse_addresses(nets))
-                            changed = True
-                            # Don't increment i to check new network with next
-                        else:
-                            i += 1
-                    else:
-                        i += 1
-
-            # Check if we've reached target
-            if len(nets) <= target_max:
-                break
+        max_cost = 16777216
+        max_bits = 32 if version == 4 else 128
+        network_cls = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+
+        # The working set is kept as parallel integer lists (first address,
+        # last address, prefix) forming a doubly linked list in address
+        # order; merged networks are appended and replaced ones marked dead
+        nets.sort(key=lambda n: int(n.network_address))
+        starts = [int(n.network_address) for n in nets]
+        ends = [int(n.broadcast_address) for n in nets]
+        prefixes = [n.prefixlen for n in nets]
+        alive = [True] * len(nets)
+        prev = list(range(-1, len(nets) - 1))
+        nxt = list(range(1, len(nets) + 1))
+        nxt[-1] = -1
+        heap: list[tuple[int, int, int, int, int]] = []
+        seq = 0
+
+        def push_pair(left: int, right: int) -> None:
+            nonlocal seq
+            if left < 0 or right < 0:
+                return
+            # Smallest aligned block spanning both, as in find_minimal_supernet
+            prefix_len = max_bits - (starts[left] ^ ends[right]).bit_length()
+            size = 1 << (max_bits - prefix_len)
+            cost = (
+                size
+                - (ends[left] - starts[left] + 1)
+                - (ends[right] - starts[right] + 1)
+            )
+            # Joining two halves adds no addresses, so like
+            # collapse_addresses it is allowed past min_prefix
+            if cost <= max_cost and (prefix_len >= min_prefix or cost == 0):
+                heapq.heappush(heap, (cost, seq, left, right, prefix_len))
+                seq += 1
+
+        for i in range(len(nets) - 1):
+            push_pair(i, i + 1)
+
+        count = len(nets)
+        while heap and count > target_max:
+            _, _, left, right, prefix_len = heapq.heappop(heap)
+            # Skip pairs whose ends were merged away since they were queued
+            if not (alive[left] and alive[right]):
+                continue
 
-        return nets
+            alive[left] = alive[right] = False
+            count -= 1
+            host_bits = max_bits - prefix_len
+            start = starts[left] >> host_bits << host_bits
+            end = start + (1 << host_bits) - 1
+
+            # The aligned supernet can swallow further neighbours whole
+            before, after = prev[left], nxt[right]
+            while before >= 0 and starts[before] >= start:
+                alive[before] = False
+                count -= 1
+                before = prev[before]
+            while after >= 0 and ends[after] <= end:
+                alive[after] = False
+                count -= 1
+                after = nxt[after]
+
+            merged = len(starts)
+            starts.append(start)
+            ends.append(end)
+            prefixes.append(prefix_len)
+            alive.append(True)
+            prev.append(before)
+            nxt.append(after)
+            if before >= 0:
+                nxt[before] = merged
+            if after >= 0:
+                prev[after] = merged
+            push_pair(before, merged)
+            push_pair(merged, after)
+
+        # Walk the list from its head to return networks in address order
+        result = []
+        node = next(i for i, live in enumerate(alive) if live and prev[i] < 0)
+        while node >= 0:
+            result.append(network_cls((starts[node], prefixes[node])))
+            node = nxt[node]
+        return result
 
     @staticmethod
     def verify_coverage(
@@ -450,35 +601,63 @@ class NetworkCompactor:
         except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
             original_nets = [ipaddress.IPv6Network(c) for c in original_cidrs]
 
+        # With compacted networks sorted by start, every candidate that starts
+        # at or before an original network is a prefix of the list; the
+        # original is covered iff the furthest end in that prefix reaches it
+        ordered = sorted(
+            (int(net.network_address), int(net.broadcast_address))
+            for net in compacted_nets
+        )
+        starts = [start for start, _ in ordered]
+        reach = list(itertools.accumulate((end for _, end in ordered), max))
+
         not_covered = []
         for orig_net in original_nets:
-            is_covered = any(
-                orig_net.subnet_of(comp_net) or orig_net == comp_net
-                for comp_net in compacted_nets
-            )
-            if not is_covered:
+            i = bisect.bisect_right(starts, int(orig_net.network_address)) - 1
+            if i < 0 or reach[i] < int(orig_net.broadcast_address):
                 not_covered.append(str(orig_net))
 
         return (len(not_covered) == 0, not_covered)
 
 
 # Convenience functions for backward compatibility
+@lru_cache(maxsize=16)
+def _get_processor(
+    ipv4_block_prefix: int = 18,
+    ipv6_block_prefix: int = 32,
+    enable_compaction: bool = False,
+    compact_target_max: int = 200,
+    compact_min_prefix_v4: int = 11,
+    compact_min_prefix_v6: int = 32,
+) -> IPProcessor:
+    """Return a shared IPProcessor for the given settings.
+
+    Processors hold no per-call state, so one instance per distinct
+    configuration serves every convenience call.
+    """
+    return IPProcessor(
+        ipv4_block_prefix=ipv4_block_prefix,
+        ipv6_block_prefix=ipv6_block_prefix,
+        enable_compaction=enable_compaction,
+        compact_target_max=compact_target_max,
+        compact_min_prefix_v4=compact_min_prefix_v4,
+        compact_min_prefix_v6=compact_min_prefix_v6,
+    )
+
+
 def ipv4_cover_blocks(cidr: str, target_pfx: int = 18) -> list[str]:
     """Return list of covering IPv4 blocks with target prefix."""
-    processor = IPProcessor(ipv4_block_prefix=target_pfx)
-    return processor.ipv4_cover_blocks(cidr)
+    return _get_processor(ipv4_block_prefix=target_pfx).ipv4_cover_blocks(cidr)
 
 
 def ipv6_cidr_to_blocks(cidr: str, target_pfx: int = 32) -> list[str]:
     """Convert IPv6 CIDR to list of target prefix blocks."""
-    processor = IPProcessor(ipv6_block_prefix=target_pfx)
-    return processor.ipv6_cidr_to_blocks(cidr)
+    return _get_processor(ipv6_block_prefix=target_pfx).ipv6_cidr_to_blocks(cidr)
 
 
 def dedupe_lines(lines: list[str]) -> list[str]:
     """Stable de-duplication while preserving first occurrence order."""
-    processor = IPProcessor()
-    return processor.dedupe_lines(lines)
+    return _get_processor().dedupe_lines(lines)
 
 
 def netset_expand(
@@ -506,13 +685,13 @@ def netset_expand(
     Returns:
         List of expanded and optionally compacted rules
     """
-    processor = IPProcessor(
-        ipv4_block_prefix=ipv4_block_prefix,
-        ipv6_block_prefix=ipv6_block_prefix,
-        enable_compaction=enable_compaction,
-        compact_target_max=compact_target_max,
-        compact_min_prefix_v4=compact_min_prefix_v4,
-        compact_min_prefix_v6=compact_min_prefix_v6,
+    processor = _get_processor(
+        ipv4_block_prefix,
+        ipv6_block_prefix,
+        enable_compaction,
+        compact_target_max,
+        compact_min_prefix_v4,
+        compact_min_prefix_v6,
     )
     return processor.netset_expand(text, suffix)
 
@@ -559,3 +738,35 @@ def compact_ipv6_networks(
         cidrs, target_max=target_max, min_prefix=min_prefix, version=6
     )
     return [str(net) for net in nets]
+
+
+def extract_query_params(query: str, keys: frozenset[str]) -> dict[str, str]:
+    """Extract selected parameters from a raw query string in one pass.
+
+    Mirrors ``parse_qs`` semantics for the keys we care about (first value
+    wins, blank values are dropped) but only decodes the requested values and
+    stops as soon as every key has been found.
+
+    Args:
+        query: Raw query string (without the leading ``?``)
+        keys: Parameter names to extract
+
+    Returns:
+        Mapping of found keys to their decoded values
+    """
+    found: dict[str, str] = {}
+    if not query:
+        return found
+
+    for pair in query.split("&"):
+        name, sep, value = pair.partition("=")
+        if not sep or not value:
+            continue
+        if "%" in name or "+" in name:
+            name = unquote_plus(name)
+        if name in keys and name not in found:
+            found[name] = unquote_plus(value)
+            if len(found) == len(keys):
+                break
+
+    return found
@@ -4,8 +4,13 @@ from unittest.mock import Mock, patch
 
 import pytest
 from fastapi import HTTPException
+from starlette.datastructures import QueryParams
 
-from src.auth import extract_template_tags, require_auth, verify_auth
+from src.auth import (
+    extract_template_tags,
+    require_auth,
+    verify_auth,
+)
 
 
 class TestAuth:
@@ -18,7 +23,7 @@ class TestAuth:
 
         # Mock request without parameters
         mock_request = Mock()
-        mock_request.url.query = ""
+        mock_request.query_params = QueryParams("")
 
         result = verify_auth(mock_request)
         assert result is False
@@ -30,7 +35,18 @@ class TestAuth:
 
         # Mock request with invalid hash
         mock_request = Mock()
-        mock_request.url.query = "u=testuser&hash=invalid"
+        mock_request.query_params = QueryParams("u=testuser&hash=invalid")
+
+        result = verify_auth(mock_request)
+        assert result is False
+
+    @patch("src.auth.settings")
+    def test_verify_auth_non_hex_hash(self, mock_settings):
+        """Test authentication with a hash that is not valid hex."""
+        mock_settings.salt = "test-salt"
+
+        mock_request = Mock()
+        mock_request.query_params = QueryParams("u=testuser&hash=not-a-hex-digest")
 
         result = verify_auth(mock_request)
         assert result is False
@@ -47,11 +63,58 @@ class TestAuth:
 
         # Mock request with valid parameters
         mock_request = Mock()
-        mock_request.url.query = f"u=testuser&hash={expected_hash}"
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
 
         result = verify_auth(mock_request)
         assert result is True
 
+    @patch("src.auth.settings")
+    def test_verify_auth_requires_exact_hexdigest(self, mock_settings):
+        """Test uppercase or space-separated spellings of the hash are rejected."""
+        import hashlib
+
+        mock_settings.salt = "test-salt"
+        expected_hash = hashlib.sha256(b"testuser.test-salt").hexdigest()
+        spaced_hash = " ".join(
+            expected_hash[i : i + 2] for i in range(0, len(expected_hash), 2)
+        )
+
+        for hash_param in (expected_hash.upper(), spaced_hash, "é" + expected_hash):
+            mock_request = Mock()
+            mock_request.query_params = QueryParams(
+                {"u": "testuser", "hash": hash_param}
+            )
+            assert verify_auth(mock_request) is False
+
+    @patch("src.auth.settings")
+    def test_verify_auth_skips_blank_values(self, mock_settings):
+        """Test blank repeated parameters are ignored like parse_qs did."""
+        import hashlib
+
+        mock_settings.salt = "test-salt"
+        expected_hash = hashlib.sha256(b"bob.test-salt").hexdigest()
+
+        mock_request = Mock()
+        mock_request.query_params = QueryParams(f"u=&u=bob&hash=&hash={expected_hash}")
+
+        assert verify_auth(mock_request) is True
+
+    @patch("src.auth.settings")
+    def test_verify_auth_salt_rotation(self, mock_settings):
+        """Test cached verification does not survive a salt change."""
+        import hashlib
+
+        mock_settings.salt = "test-salt"
+        expected_hash = hashlib.sha256(b"testuser.test-salt").hexdigest()
+
+        mock_request = Mock()
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
+
+        assert verify_auth(mock_request) is True
+
+        mock_settings.salt = "rotated-salt"
+        assert verify_auth(mock_request) is False
+
     @patch("src.auth.settings")
     def test_verify_auth_with_proxy_config_valid_user(self, mock_settings):
         """Test authentication with valid user in proxy config."""
@@ -64,7 +127,7 @@ class TestAuth:
 
         # Mock request with valid parameters
         mock_request = Mock()
-        mock_request.url.query = f"u=testuser&hash={expected_hash}"
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
 
         # Mock proxy config with valid user
         mock_proxy_config = Mock()
@@ -85,7 +148,7 @@ class TestAuth:
 
         # Mock request with valid parameters
         mock_request = Mock()
-        mock_request.url.query = f"u=testuser&hash={expected_hash}"
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
 
         # Mock proxy config without the user
         mock_proxy_config = Mock()
@@ -106,7 +169,7 @@ class TestAuth:
 
         # Mock request with valid parameters
         mock_request = Mock()
-        mock_request.url.query = f"u=testuser&hash={expected_hash}"
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
 
         # Mock proxy config with empty users list
         mock_proxy_config = Mock()
@@ -119,7 +182,7 @@ class TestAuth:
         """Test require_auth raises exception on failure."""
         # Mock request without parameters
         mock_request = Mock()
-        mock_request.url.query = ""
+        mock_request.query_params = QueryParams("")
 
         with pytest.raises(HTTPException) as exc_info:
             require_auth(mock_request)
@@ -135,7 +198,7 @@ class TestAuth:
         expected_hash = hashlib.sha256(b"testuser.test-salt").hexdigest()
 
         mock_request = Mock()
-        mock_request.url.query = f"u=testuser&hash={expected_hash}"
+        mock_request.query_params = QueryParams(f"u=testuser&hash={expected_hash}")
 
         # Mock proxy config without the user
         mock_proxy_config = Mock()
@@ -0,0 +1,52 @@
+"""Tests for in-process cache helpers."""
+
+from unittest.mock import patch
+
+from src.cache import TTLCache
+
+
+class TestTTLCache:
+    """Test TTLCache behaviour."""
+
+    def test_get_missing(self) -> None:
+        """Test missing keys return the default."""
+        cache = TTLCache(maxsize=2, ttl=10.0)
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+
+    def test_entry_expires(self) -> None:
+        """Test entries are dropped once their TTL has passed."""
+        cache = TTLCache(maxsize=2, ttl=10.0)
+
+        with patch("src.cache.time.monotonic", return_value=0.0):
+            cache.set("key", "value")
+        with patch("src.cache.time.monotonic", return_value=5.0):
+            assert cache.get("key") == "value"
+        with patch("src.cache.time.monotonic", return_value=10.0):
+            assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_evicts_expired_before_oldest(self) -> None:
+        """Test a full cache drops expired entries before live ones."""
+        cache = TTLCache(maxsize=2, ttl=10.0)
+
+        with patch("src.cache.time.monotonic", return_value=0.0):
+            cache.set("old", 1)
+        with patch("src.cache.time.monotonic", return_value=8.0):
+            cache.set("live", 2)
+        with patch("src.cache.time.monotonic", return_value=12.0):
+            cache.set("new", 3)
+            assert cache.get("live") == 2
+            assert cache.get("new") == 3
+            assert cache.get("old") is None
+
+    def test_evicts_oldest_when_full(self) -> None:
+        """Test the oldest insertion is evicted when all entries are live."""
+        cache = TTLCache(maxsize=2, ttl=10.0)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert cache.get("c") == 3
@@ -3,6 +3,7 @@
 from unittest.mock import AsyncMock
 
 import pytest
+import yaml
 
 from src.clash_processor import ClashProcessor
 from src.processor import TemplateProcessor
@@ -40,6 +41,20 @@ log-level: info
         assert result["allow-lan"] is True
         assert result["mode"] == "Rule"
 
+    def test_parse_clash_yaml_cached_copy(
+        self, clash_processor: ClashProcessor
+    ) -> None:
+        """Test cached parses are returned as independent copies."""
+        yaml_content = """
+proxies:
+  - PROXY_CONFIGS
+"""
+        first = clash_processor.parse_clash_yaml(yaml_content)
+        first["proxies"].append("mutated")
+
+        second = clash_processor.parse_clash_yaml(yaml_content)
+        assert second["proxies"] == ["PROXY_CONFIGS"]
+
     def test_extract_rule_sets(self, clash_processor: ClashProcessor) -> None:
         """Test extracting RULE-SET entries."""
         clash_config = {
@@ -74,7 +89,36 @@ rules:
   - DOMAIN-SUFFIX,example.com,PROXY
 """
         result = await clash_processor.process_clash_config(yaml_content, "", {})
-        assert "DOMAIN-SUFFIX,example.com,PROXY" in result
+        assert b"DOMAIN-SUFFIX,example.com,PROXY" in result
+
+    @pytest.mark.asyncio
+    async def test_process_clash_config_no_rule_sets_keeps_key_order(
+        self, clash_processor: ClashProcessor
+    ) -> None:
+        """Test the YAML re-emit keeps the template's key order."""
+        yaml_content = """
+mode: Rule
+allow-lan: true
+rules:
+  - DOMAIN-SUFFIX,example.com,PROXY
+"""
+        result = await clash_processor.process_clash_config(yaml_content, "", {})
+        assert list(yaml.safe_load(result)) == ["mode", "allow-lan", "rules"]
+
+    @pytest.mark.asyncio
+    async def test_process_clash_config_returns_utf8_bytes(
+        self, clash_processor: ClashProcessor
+    ) -> None:
+        """Test processed config is returned as UTF-8 encoded bytes."""
+        yaml_content = """
+proxy-groups:
+  - name: Прокси
+rules:
+  - DOMAIN-SUFFIX,example.com,Прокси
+"""
+        result = await clash_processor.process_clash_config(yaml_content, "", {})
+        assert isinstance(result, bytes)
+        assert "Прокси" in result.decode("utf-8")
 
     @pytest.mark.asyncio
     async def test_process_clash_config_with_rule_sets(
@@ -95,6 +139,36 @@ rules:
         result = await clash_processor.process_clash_config(yaml_content, "", {})
 
         # Should contain the expanded rule but not the original RULE-SET
-        assert "DOMAIN-SUFFIX,test.com,PROXY" in result
-        assert "RULE-SET,https://example.com/list.txt,PROXY" not in result
-        assert "DOMAIN-SUFFIX,example.com,PROXY" in result
+        assert b"DOMAIN-SUFFIX,test.com,PROXY" in result
+        assert b"RULE-SET,https://example.com/list.txt,PROXY" not in result
+        assert b"DOMAIN-SUFFIX,example.com,PROXY" in result
+
+    @pytest.mark.asyncio
+    async def test_process_clash_config_multiple_rule_sets_order(
+        self, clash_processor: ClashProcessor
+    ) -> None:
+        """Test expanded RULE-SETs are spliced back at their own positions."""
+
+        async def fake_process_template(template, incoming_host, request_headers):
+            name = template.split(",")[1].rsplit("/", 1)[-1]
+            return f"# RULE-SET,{name}\nDOMAIN-SUFFIX,{name}.com,PROXY"
+
+        clash_processor.template_processor.process_template = fake_process_template
+
+        yaml_content = """
+rules:
+  - DOMAIN,first.com,DIRECT
+  - RULE-SET,https://example.com/a,PROXY
+  - DOMAIN,middle.com,DIRECT
+  - RULE-SET,https://example.com/b,PROXY
+  - MATCH,DIRECT
+"""
+        result = await clash_processor.process_clash_config(yaml_content, "", {})
+
+        assert yaml.safe_load(result)["rules"] == [
+            "DOMAIN,first.com,DIRECT",
+            "DOMAIN-SUFFIX,a.com,PROXY",
+            "DOMAIN,middle.com,DIRECT",
+            "DOMAIN-SUFFIX,b.com,PROXY",
+            "MATCH,DIRECT",
+        ]
@@ -294,3 +294,31 @@ proxy-groups:
             assert "servername" in config
             assert config["skip-cert-verify"] is True
             assert config["udp"] is True
+
+    def test_splice_proxy_placeholders_matches_structural(
+        self, clash_processor: ClashProcessor, sample_clash_yaml: str
+    ) -> None:
+        """Test textual placeholder splicing yields the same config as parsing."""
+        request_headers = {"x-query-string": "u=dimonb&hash=abc"}
+
+        spliced = clash_processor.splice_proxy_placeholders(
+            sample_clash_yaml, request_headers
+        )
+        expected = clash_processor.replace_proxy_placeholders(
+            clash_processor.parse_clash_yaml(sample_clash_yaml), request_headers
+        )
+
+        assert spliced is not None
+        assert yaml.safe_load(spliced) == expected
+
+    def test_splice_proxy_placeholders_skips_rule_sets(
+        self, clash_processor: ClashProcessor
+    ) -> None:
+        """Test templates with RULE-SET entries fall back to the full path."""
+        yaml_content = """
+proxies:
+  - PROXY_CONFIGS
+rules:
+  - RULE-SET,https://example.com/list.txt,PROXY
+"""
+        assert clash_processor.splice_proxy_placeholders(yaml_content, {}) is None
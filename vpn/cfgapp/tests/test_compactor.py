@@ -1,6 +1,7 @@
 """Tests for NetworkCompactor class and IPProcessor integration."""
 
 import ipaddress
+import itertools
 import pytest
 
 from src.utils import (
@@ -100,6 +101,38 @@ class TestNetworkCompactor:
         is_covered, _ = NetworkCompactor.verify_coverage(cidrs, result)
         assert is_covered
 
+    def test_compact_networks_merges_cheapest_pair_first(self):
+        """Test the merge adding the fewest addresses wins over scan order."""
+        cidrs = ["10.0.0.0/24", "10.0.8.0/24", "10.0.10.0/24"]
+        result = NetworkCompactor.compact_networks(
+            cidrs, target_max=2, min_prefix=16, version=4
+        )
+        assert result == [
+            ipaddress.IPv4Network("10.0.0.0/24"),
+            ipaddress.IPv4Network("10.0.8.0/22"),
+        ]
+
+    def test_compact_networks_joins_halves_past_min_prefix(self):
+        """Test min_prefix only limits merges that add addresses."""
+        cidrs = ["10.0.0.0/10", "10.64.0.0/11", "10.128.0.0/9"]
+        result = NetworkCompactor.compact_networks(
+            cidrs, target_max=1, min_prefix=9, version=4
+        )
+        # 10.0.0.0/9 is a costly merge at min_prefix; its sibling joins free
+        assert result == [ipaddress.IPv4Network("10.0.0.0/8")]
+
+    def test_compact_networks_returns_sorted_disjoint_networks(self):
+        """Test merged networks come back in address order without overlaps."""
+        cidrs = [f"10.{i % 4}.{i * 37 % 256}.0/24" for i in range(60)]
+        result = NetworkCompactor.compact_networks(
+            cidrs, target_max=10, min_prefix=12, version=4
+        )
+        assert len(result) <= 10
+        assert result == sorted(result)
+        assert not any(a.overlaps(b) for a, b in itertools.pairwise(result))
+        is_covered, _ = NetworkCompactor.verify_coverage(cidrs, result)
+        assert is_covered
+
     def test_verify_coverage_full(self):
         """Test coverage verification with full coverage."""
         original = ["192.168.0.0/24", "192.168.1.0/24"]
@@ -120,6 +153,19 @@ class TestNetworkCompactor:
         assert not is_covered
         assert "10.0.0.0/8" in not_covered
 
+    def test_verify_coverage_nested_compacted(self):
+        """Test coverage by an outer network when a nested one starts later."""
+        original = ["10.2.0.0/16", "10.1.5.0/24", "11.0.0.0/24"]
+        compacted = [
+            ipaddress.IPv4Network("10.1.0.0/16"),
+            ipaddress.IPv4Network("10.0.0.0/8"),
+        ]
+        is_covered, not_covered = NetworkCompactor.verify_coverage(
+            original, compacted
+        )
+        assert not is_covered
+        assert not_covered == ["11.0.0.0/24"]
+
     def test_compact_ipv4_networks_convenience(self):
         """Test convenience function for IPv4."""
         cidrs = ["192.168.0.0/24", "192.168.1.0/24"]
@@ -5,6 +5,7 @@ from unittest.mock import Mock, patch
 import pytest
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from starlette.datastructures import QueryParams
 
 from src.main import app
 
@@ -19,6 +20,61 @@ class TestMainApp:
         assert response.status_code == 200
         assert response.json() == {"status": "healthy", "version": "0.1.0"}
 
+    def test_http_client_lifecycle(self) -> None:
+        """Test the shared upstream client lives for the app lifespan."""
+        import src.main
+
+        with TestClient(app):
+            client = src.main.http_client
+            assert client is not None
+            assert src.main.get_http_client() is client
+
+        assert src.main.http_client is None
+        assert client.is_closed
+
+    def test_page_templates_prewarmed(self) -> None:
+        """Test page templates are compiled at startup and not re-checked."""
+        import src.main
+
+        src.main.templates.env.cache.clear()
+
+        with TestClient(app):
+            names = [key[1] for key in src.main.templates.env.cache.keys()]
+
+        assert "subscription.html" in names
+        assert src.main.templates.env.auto_reload is False
+
+    def test_forward_headers_strip_cookie_and_host(self) -> None:
+        """Test upstream headers drop cookie, host and hop-by-hop headers."""
+        from starlette.requests import Request
+
+        from src.main import _forward_headers
+
+        request = Request(
+            {
+                "type": "http",
+                "headers": [
+                    (b"host", b"cfg.example.com"),
+                    (b"user-agent", b"clash"),
+                    (b"cookie", b"session=1"),
+                    (b"accept", b"text/yaml"),
+                    (b"accept", b"*/*"),
+                    (b"Connection", b"keep-alive"),
+                    (b"keep-alive", b"timeout=5"),
+                    (b"proxy-connection", b"keep-alive"),
+                    (b"transfer-encoding", b"chunked"),
+                    (b"upgrade", b"h2c"),
+                    (b"te", b"trailers"),
+                ],
+            }
+        )
+
+        assert _forward_headers(request) == [
+            (b"user-agent", b"clash"),
+            (b"accept", b"text/yaml"),
+            (b"accept", b"*/*"),
+        ]
+
     @pytest.mark.asyncio
     async def test_http_exception_propagation(self) -> None:
         """Test that HTTPException is properly propagated instead of being converted to 500."""
@@ -26,7 +82,7 @@ class TestMainApp:
 
         # Create a mock request that will fail authentication
         request = Mock()
-        request.url.query = ""
+        request.query_params = QueryParams("")
 
         # This should raise HTTPException with 401 status
         with pytest.raises(HTTPException) as exc_info:
@@ -84,3 +140,175 @@ class TestMainApp:
         assert "application/json" not in response.headers.get("content-type", "")
         # The content could be unaltered bytes or a re-serialized representation
         assert b"proxies:" in response.content
+
+    @patch("src.main.forward_request")
+    def test_proxy_handler_caches_origin_404_only(self, mock_forward: Mock) -> None:
+        """Test repeated requests reuse an origin 404 but not a found page."""
+        import httpx
+
+        import src.main
+
+        src.main.origin_cache.clear()
+        src.main.template_paths.clear()
+
+        async def fake_forward(request, path_with_search):
+            if path_with_search.startswith("/found.yaml"):
+                return httpx.Response(status_code=200, content=b"found: true")
+            return httpx.Response(status_code=404, content=b"")
+
+        mock_forward.side_effect = fake_forward
+
+        client = TestClient(app)
+        for _ in range(2):
+            assert client.get("/found.yaml?u=test").content == b"found: true"
+            assert client.get("/missing.yaml?u=test").status_code == 404
+
+        origin_calls = [c.args[1] for c in mock_forward.call_args_list]
+        assert origin_calls.count("/found.yaml?u=test") == 2
+        assert origin_calls.count("/missing.yaml?u=test") == 1
+        assert origin_calls.count("/missing.yaml.tpl?u=test") == 1
+
+    @patch("src.main.forward_request")
+    def test_proxy_handler_skips_cache_for_credentials(
+        self, mock_forward: Mock
+    ) -> None:
+        """Test requests with Authorization always reach origin themselves."""
+        import httpx
+
+        import src.main
+
+        src.main.origin_cache.clear()
+        mock_forward.return_value = httpx.Response(
+            status_code=404,
+            content=b"",
+            request=httpx.Request("GET", "https://example.com/private.yaml"),
+        )
+
+        client = TestClient(app)
+        client.get("/private.yaml", headers={"Authorization": "Bearer a"})
+        client.get("/private.yaml", headers={"Authorization": "Bearer b"})
+
+        origin_calls = [
+            c for c in mock_forward.call_args_list if c.args[1] == "/private.yaml"
+        ]
+        assert len(origin_calls) == 2
+
+    def test_is_cacheable_only_accepts_404(self) -> None:
+        """Test only origin 404s that allow caching are remembered."""
+        import httpx
+
+        from src.main import _is_cacheable
+
+        def response(status_code: int, headers=()) -> httpx.Response:
+            return httpx.Response(status_code=status_code, headers=list(headers))
+
+        assert _is_cacheable(response(404))
+        assert not _is_cacheable(response(200))
+        assert not _is_cacheable(response(500))
+        assert not _is_cacheable(response(404, [("cache-control", "no-store")]))
+        assert not _is_cacheable(response(404, [("cache-control", "private")]))
+
+    @patch("src.main.forward_request")
+    def test_proxy_handler_probes_template_concurrently(
+        self, mock_forward: Mock
+    ) -> None:
+        """Test known template paths fetch the template before the origin 404."""
+        import asyncio
+
+        import httpx
+
+        import src.main
+
+        src.main.origin_cache.clear()
+        src.main.render_cache.clear()
+        src.main.template_paths.set("/probe.txt", True)
+        started: list[str] = []
+
+        async def fake_forward(request, path_with_search):
+            started.append(path_with_search)
+            if path_with_search.startswith("/probe.txt.tpl"):
+                return httpx.Response(status_code=200, content=b"hello from tpl")
+            # Origin only answers once the template request is in flight
+            while not any(p.startswith("/probe.txt.tpl") for p in started):
+                await asyncio.sleep(0)
+            return httpx.Response(status_code=404, content=b"")
+
+        mock_forward.side_effect = fake_forward
+
+        client = TestClient(app)
+        response = client.get("/probe.txt")
+
+        assert response.status_code == 200
+        assert response.content == b"hello from tpl"
+        assert sorted(started) == ["/probe.txt", "/probe.txt.tpl"]
+        # Rendered bodies are cached already encoded
+        assert src.main.render_cache.get(("testserver", "/probe.txt")) == (
+            b"hello from tpl"
+        )
+
+    @patch("src.main.render_template")
+    @patch("src.main.forward_request")
+    def test_proxy_handler_skips_caching_degraded_or_large_renders(
+        self, mock_forward: Mock, mock_render: Mock
+    ) -> None:
+        """Test failed expansions and oversized bodies are rendered every time."""
+        import httpx
+
+        import src.main
+
+        src.main.origin_cache.clear()
+        src.main.render_cache.clear()
+
+        async def fake_forward(request, path_with_search):
+            if path_with_search.endswith(".tpl"):
+                return httpx.Response(status_code=200, content=b"RULE-SET,x,PROXY")
+            return httpx.Response(status_code=404, content=b"")
+
+        mock_forward.side_effect = fake_forward
+        large = b"#" * (src.main.RENDER_CACHE_MAX_BODY + 1)
+        mock_render.side_effect = [
+            (b"# RULE-SET fetch failed: x", False),
+            (large, True),
+            (b"IP-CIDR,10.0.0.0/8,PROXY", True),
+        ]
+
+        client = TestClient(app)
+        assert client.get("/rules.txt").content == b"# RULE-SET fetch failed: x"
+        assert src.main.render_cache.get(("testserver", "/rules.txt")) is None
+        assert client.get("/rules.txt").content == large
+        assert src.main.render_cache.get(("testserver", "/rules.txt")) is None
+        assert client.get("/rules.txt").content == b"IP-CIDR,10.0.0.0/8,PROXY"
+        assert client.get("/rules.txt").content == b"IP-CIDR,10.0.0.0/8,PROXY"
+        assert mock_render.call_count == 3
+
+    @patch("src.main.forward_request")
+    def test_proxy_handler_probes_template_only_for_known_paths(
+        self, mock_forward: Mock
+    ) -> None:
+        """Test other paths fetch the template only after the origin 404."""
+        import httpx
+
+        import src.main
+
+        src.main.origin_cache.clear()
+        src.main.render_cache.clear()
+        src.main.template_paths.clear()
+        started: list[str] = []
+
+        async def fake_forward(request, path_with_search):
+            started.append(path_with_search)
+            if path_with_search == "/new.txt.tpl":
+                return httpx.Response(status_code=200, content=b"hello from tpl")
+            if path_with_search == "/new.txt":
+                return httpx.Response(status_code=404, content=b"")
+            return httpx.Response(status_code=200, content=b"origin")
+
+        mock_forward.side_effect = fake_forward
+
+        client = TestClient(app)
+        assert client.get("/plain.txt").content == b"origin"
+        assert client.get("/new.txt").content == b"hello from tpl"
+
+        assert started == ["/plain.txt", "/new.txt", "/new.txt.tpl"]
+        assert src.main.template_paths.get("/new.txt") is True
+        assert src.main.template_paths.get("/plain.txt") is None
@@ -1,16 +1,31 @@
 """Tests for template processor."""
 
-from unittest.mock import AsyncMock, Mock
+from unittest.mock import AsyncMock, Mock, patch
 
 import httpx
 import pytest
 
-from src.processor import NETSET_RE, RULE_RE, TemplateProcessor
+from src.processor import (
+    NETSET_CACHE_MAX_BODY,
+    NETSET_RE,
+    RULE_RE,
+    RuleSetTask,
+    TemplateProcessor,
+    _normalize_rule,
+    get_netset_pool,
+    netset_body_cache,
+    shutdown_netset_pool,
+)
 
 
 class TestTemplateProcessor:
     """Test TemplateProcessor class."""
 
+    @pytest.fixture(autouse=True)
+    def clear_netset_cache(self) -> None:
+        """Start every test without cached NETSET bodies."""
+        netset_body_cache.clear()
+
     @pytest.fixture
     def http_client(self) -> AsyncMock:
         """Create mock HTTP client."""
@@ -37,14 +52,14 @@ DOMAIN,example.com,PROXY
         assert len(tasks) == 2
 
         # Check first task
-        assert tasks[0]["url"] == "https://example.com/list.txt"
-        assert tasks[0]["suffix"] == ",PROXY"
-        assert tasks[0]["index"] == 2
+        assert tasks[0].url == "https://example.com/list.txt"
+        assert tasks[0].suffix == ",PROXY"
+        assert tasks[0].index == 2
 
         # Check second task
-        assert tasks[1]["url"] == "https://test.com/block.txt"
-        assert tasks[1]["suffix"] == ",DIRECT,no-resolve"
-        assert tasks[1]["index"] == 4
+        assert tasks[1].url == "https://test.com/block.txt"
+        assert tasks[1].suffix == ",DIRECT,no-resolve"
+        assert tasks[1].index == 4
 
         # Check passthrough lines
         assert passthrough[0] == ""  # Empty line
@@ -52,6 +67,23 @@ DOMAIN,example.com,PROXY
         assert passthrough[3] == "# Another comment"
         assert passthrough[5] == "DOMAIN,example.com,PROXY"
 
+    def test_parse_template_prefix_variants(self, processor: TemplateProcessor) -> None:
+        """Test indented/lowercase RULE-SET lines and near misses."""
+        template_text = (
+            "  rule-set,https://example.com/a.txt,PROXY\n"
+            "RULE-SET,https://example.com/b.txt\n"
+            "RULE,not-a-rule-set"
+        )
+
+        tasks, passthrough, _ = processor.parse_template(template_text)
+
+        assert tasks == [RuleSetTask(0, "https://example.com/a.txt", ",PROXY")]
+        assert passthrough == [
+            None,
+            "RULE-SET,https://example.com/b.txt",
+            "RULE,not-a-rule-set",
+        ]
+
     def test_parse_template_no_rules(self, processor: TemplateProcessor) -> None:
         """Test template parsing with no RULE-SET entries."""
         template_text = """
@@ -156,13 +188,14 @@ IP-CIDR,192.168.1.0/24,DIRECT
 
         assert len(result) == 1
         assert result[0] == f"# NETSET fetch failed: {url} (404)"
+        assert processor.failed
 
     @pytest.mark.asyncio
     async def test_expand_rule_set_with_netset(
         self, processor: TemplateProcessor, http_client: AsyncMock
     ) -> None:
         """Test RULE-SET expansion with NETSET entries."""
-        task = {"url": "https://example.com/rules.txt", "suffix": ",PROXY"}
+        task = RuleSetTask(0, "https://example.com/rules.txt", ",PROXY")
         incoming_host = "example.com"
         request_headers = {"User-Agent": "test"}
 
@@ -183,7 +216,7 @@ IP-CIDR,192.168.1.0/24,DIRECT
         result = await processor.expand_rule_set(task, incoming_host, request_headers)
 
         assert len(result) > 1
-        assert result[0] == f"# RULE-SET,{task['url']}"
+        assert result[0] == f"# RULE-SET,{task.url}"
         assert any("IP-CIDR,192.168.0.0/18" in line for line in result)
 
     @pytest.mark.asyncio
@@ -191,7 +224,7 @@ IP-CIDR,192.168.1.0/24,DIRECT
         self, processor: TemplateProcessor, http_client: AsyncMock
     ) -> None:
         """Test RULE-SET expansion with regular rules."""
-        task = {"url": "https://example.com/rules.txt", "suffix": ",PROXY"}
+        task = RuleSetTask(0, "https://example.com/rules.txt", ",PROXY")
         incoming_host = "example.com"
         request_headers = {"User-Agent": "test"}
 
@@ -209,11 +242,53 @@ IP-CIDR,192.168.1.0/24,DIRECT
         result = await processor.expand_rule_set(task, incoming_host, request_headers)
 
         assert len(result) == 4  # Header + 3 rules
-        assert result[0] == f"# RULE-SET,{task['url']}"
+        assert result[0] == f"# RULE-SET,{task.url}"
         assert "DOMAIN,example.com,PROXY" in result
         assert "DOMAIN-SUFFIX,test.com,PROXY" in result  # Suffix replaced
         assert "IP-CIDR,192.168.1.0/24,PROXY" in result  # Suffix added
 
+    @pytest.mark.asyncio
+    async def test_expand_rule_set_normalizes_commas(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test whitespace around commas is removed and suffixes replaced."""
+        task = RuleSetTask(0, "https://example.com/rules.txt", ",DIRECT,no-resolve")
+
+        rule_response = AsyncMock()
+        rule_response.text = """
+DOMAIN , spaced.com , reject
+IP-CIDR ,10.0.0.0/8 # private
+DOMAIN-KEYWORD,  tracker
+"""
+        rule_response.raise_for_status = Mock()
+
+        http_client.get.return_value = rule_response
+
+        result = await processor.expand_rule_set(task, "example.com", {})
+
+        assert result[1:] == [
+            "DOMAIN,spaced.com,DIRECT,no-resolve",
+            "IP-CIDR,10.0.0.0/8,DIRECT,no-resolve",
+            "DOMAIN-KEYWORD,tracker,DIRECT,no-resolve",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_expand_rule_set_crlf_body(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test rule lists with CRLF line endings."""
+        task = RuleSetTask(0, "https://example.com/rules.txt", ",PROXY")
+
+        rule_response = AsyncMock()
+        rule_response.text = "DOMAIN,a.com\r\n#comment\r\nDOMAIN,b.com,DIRECT\r\n"
+        rule_response.raise_for_status = Mock()
+
+        http_client.get.return_value = rule_response
+
+        result = await processor.expand_rule_set(task, "example.com", {})
+
+        assert result[1:] == ["DOMAIN,a.com,PROXY", "DOMAIN,b.com,PROXY"]
+
     @pytest.mark.asyncio
     async def test_process_template(
         self, processor: TemplateProcessor, http_client: AsyncMock
@@ -243,6 +318,235 @@ DOMAIN,example.com,PROXY
         assert "DOMAIN,test.com,PROXY" in result
         assert "DOMAIN,example.com,PROXY" in result
 
+    @pytest.mark.asyncio
+    async def test_process_template_dedupes_merged_lines(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test duplicates are dropped by stripped key across all merged lines."""
+        template_text = (
+            "  DOMAIN,test.com,PROXY\n"
+            "RULE-SET,https://example.com/rules.txt,PROXY\n"
+            "\n"
+            "DOMAIN,other.com,PROXY\n"
+            "  DOMAIN,other.com,PROXY"
+        )
+
+        rule_response = AsyncMock()
+        rule_response.text = "DOMAIN,test.com\nDOMAIN,other.com\nDOMAIN,test.com"
+        rule_response.raise_for_status = Mock()
+        http_client.get.return_value = rule_response
+
+        result = await processor.process_template(template_text, "example.com", {})
+
+        assert result.split("\n") == [
+            "  DOMAIN,test.com,PROXY",
+            "# RULE-SET,https://example.com/rules.txt",
+            "DOMAIN,other.com,PROXY",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_process_template_shares_netset_fetch(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test RULE-SETs including the same NETSET download it only once."""
+        template_text = (
+            "RULE-SET,https://lists.com/a.txt,PROXY\n"
+            "RULE-SET,https://lists.com/b.txt,DIRECT"
+        )
+
+        async def fake_get(url, **kwargs):
+            response = Mock()
+            response.is_success = True
+            response.raise_for_status = Mock()
+            if url == "https://lists.com/nets.txt":
+                response.text = "10.0.0.0/8"
+            else:
+                response.text = "#NETSET https://lists.com/nets.txt"
+            return response
+
+        http_client.get.side_effect = fake_get
+
+        result = await processor.process_template(template_text, "example.com", {})
+
+        fetched = [c.args[0] for c in http_client.get.call_args_list]
+        assert fetched.count("https://lists.com/nets.txt") == 1
+        lines = result.split("\n")
+        assert any(
+            line.startswith("IP-CIDR,10.") and line.endswith(",PROXY") for line in lines
+        )
+        assert any(
+            line.startswith("IP-CIDR,10.") and line.endswith(",DIRECT")
+            for line in lines
+        )
+
+    @pytest.mark.asyncio
+    async def test_process_template_memoizes_rule_set_fetch(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test the same RULE-SET URL is downloaded once per render."""
+        template_text = (
+            "RULE-SET,https://lists.com/a.txt,PROXY\n"
+            "RULE-SET,https://lists.com/a.txt,DIRECT"
+        )
+
+        rule_response = AsyncMock()
+        rule_response.text = "DOMAIN,test.com"
+        rule_response.raise_for_status = Mock()
+        http_client.get.return_value = rule_response
+
+        result = await processor.process_template(template_text, "example.com", {})
+
+        http_client.get.assert_called_once_with("https://lists.com/a.txt")
+        assert "DOMAIN,test.com,PROXY" in result
+        assert "DOMAIN,test.com,DIRECT" in result
+
+    @pytest.mark.asyncio
+    async def test_netset_body_reused_across_renders(
+        self, http_client: AsyncMock
+    ) -> None:
+        """Test a NETSET body is downloaded once for several processors."""
+        url = "https://lists.com/nets.txt"
+
+        mock_response = AsyncMock()
+        mock_response.is_success = True
+        mock_response.text = "10.0.0.0/8"
+        http_client.get.return_value = mock_response
+
+        first = await TemplateProcessor(http_client).fetch_netset(url)
+        second = await TemplateProcessor(http_client).fetch_netset(url)
+
+        assert first == second == "10.0.0.0/8"
+        http_client.get.assert_called_once_with(url)
+
+    @pytest.mark.asyncio
+    async def test_large_netset_body_not_cached(self, http_client: AsyncMock) -> None:
+        """Test NETSET bodies over the size limit are downloaded every render."""
+        url = "https://lists.com/big.txt"
+
+        mock_response = AsyncMock()
+        mock_response.is_success = True
+        mock_response.text = "10.0.0.0/8\n" * (NETSET_CACHE_MAX_BODY // 10)
+        http_client.get.return_value = mock_response
+
+        await TemplateProcessor(http_client).fetch_netset(url)
+        await TemplateProcessor(http_client).fetch_netset(url)
+
+        assert http_client.get.call_count == 2
+        assert netset_body_cache.get(url) is None
+
+    @pytest.mark.asyncio
+    async def test_failed_netset_not_cached(self, http_client: AsyncMock) -> None:
+        """Test failed NETSET downloads are retried by the next render."""
+        url = "https://lists.com/nets.txt"
+
+        mock_response = AsyncMock()
+        mock_response.is_success = False
+        mock_response.status_code = 503
+        http_client.get.return_value = mock_response
+
+        await TemplateProcessor(http_client).fetch_netset(url)
+        await TemplateProcessor(http_client).fetch_netset(url)
+
+        assert http_client.get.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_large_netset_expanded_off_loop(
+        self, processor: TemplateProcessor
+    ) -> None:
+        """Test only large NETSET bodies are expanded in a worker thread."""
+        import asyncio
+
+        large = "# padding\n" * 2000 + "10.0.0.0/8"
+        with patch(
+            "src.processor.asyncio.to_thread", wraps=asyncio.to_thread
+        ) as to_thread:
+            small_result = await processor.expand_netset_body(
+                "s", "10.0.0.0/8", ",PROXY"
+            )
+            large_result = await processor.expand_netset_body("l", large, ",PROXY")
+
+        to_thread.assert_called_once()
+        assert large_result == small_result
+
+    @pytest.mark.asyncio
+    async def test_large_netsets_expanded_concurrently(
+        self, processor: TemplateProcessor, http_client: AsyncMock
+    ) -> None:
+        """Test large NETSET bodies of one RULE-SET expand at the same time."""
+        import asyncio
+
+        task = RuleSetTask(0, "https://example.com/rules.txt", ",PROXY")
+        rule_response = AsyncMock()
+        rule_response.text = (
+            "#NETSET https://example.com/a.txt\n#NETSET https://example.com/b.txt"
+        )
+        rule_response.raise_for_status = Mock()
+        netset_a = AsyncMock()
+        netset_a.text = "# padding\n" * 2000 + "10.0.0.0/8"
+        netset_a.is_success = True
+        netset_b = AsyncMock()
+        netset_b.text = "# padding\n" * 2000 + "172.16.0.0/12"
+        netset_b.is_success = True
+        http_client.get.side_effect = [rule_response, netset_a, netset_b]
+
+        in_flight = 0
+        both_started = asyncio.Event()
+
+        async def fake_to_thread(func):
+            nonlocal in_flight
+            in_flight += 1
+            if in_flight == 2:
+                both_started.set()
+            # Fails with a timeout if the expansions run one after another
+            await asyncio.wait_for(both_started.wait(), timeout=1)
+            return func()
+
+        with patch("src.processor.asyncio.to_thread", fake_to_thread):
+            result = await processor.expand_rule_set(task, "other.com", {})
+
+        assert both_started.is_set()
+        assert any(line.startswith("IP-CIDR,10.") for line in result)
+        assert any(line.startswith("IP-CIDR,172.16.") for line in result)
+
+    @pytest.mark.asyncio
+    async def test_large_netset_expanded_in_process_pool(
+        self, processor: TemplateProcessor
+    ) -> None:
+        """Test large NETSET bodies use the process pool when it is enabled."""
+        large = "# padding\n" * 2000 + "10.0.0.0/8"
+        try:
+            with patch("src.processor.settings.netset_workers", 1):
+                pool = get_netset_pool()
+                assert pool is not None
+                result = await processor.expand_netset_body("l", large, ",PROXY")
+                assert get_netset_pool() is pool
+        finally:
+            shutdown_netset_pool()
+
+        assert result == await processor.expand_netset_body("s", "10.0.0.0/8", ",PROXY")
+        assert get_netset_pool() is None
+
+    @pytest.mark.asyncio
+    async def test_broken_process_pool_falls_back_to_thread(
+        self, processor: TemplateProcessor
+    ) -> None:
+        """Test a broken process pool is dropped and the thread is used."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        broken_pool = Mock()
+        broken_pool.submit.side_effect = BrokenProcessPool("worker died")
+        large = "# padding\n" * 2000 + "10.0.0.0/8"
+        with (
+            patch("src.processor.settings.netset_workers", 1),
+            patch("src.processor._netset_pool", broken_pool),
+        ):
+            result = await processor.expand_netset_body("l", large, ",PROXY")
+            assert get_netset_pool() is not broken_pool
+            shutdown_netset_pool()
+
+        broken_pool.shutdown.assert_called_once()
+        assert result == await processor.expand_netset_body("s", "10.0.0.0/8", ",PROXY")
+
 
 class TestRegexPatterns:
     """Test regex patterns for parsing."""
@@ -289,3 +593,24 @@ class TestRegexPatterns:
 
         for case in invalid_cases:
             assert NETSET_RE.match(case) is None, f"Should not match: {case}"
+
+
+class TestNormalizeRule:
+    """Test single-line rule normalization."""
+
+    def test_normalize_rule(self) -> None:
+        """Test comment stripping, comma spacing and policy replacement."""
+        cases = {
+            "DOMAIN,example.com": "DOMAIN,example.com,PROXY",
+            "DOMAIN,example.com,direct": "DOMAIN,example.com,PROXY",
+            "DOMAIN ,\texample.com , Reject": "DOMAIN,example.com,PROXY",
+            "IP-CIDR,10.0.0.0/8 # private": "IP-CIDR,10.0.0.0/8,PROXY",
+            "DOMAIN-SUFFIX,myproxy": "DOMAIN-SUFFIX,myproxy,PROXY",
+        }
+
+        for line, expected in cases.items():
+            assert _normalize_rule(line, ",PROXY") == expected, line
+
+    def test_normalize_rule_comment_only(self) -> None:
+        """Test a line that is empty after comment removal yields None."""
+        assert _normalize_rule("   # note", ",PROXY") is None
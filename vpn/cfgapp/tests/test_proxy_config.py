@@ -59,6 +59,37 @@ class TestProxyConfig:
         proxy_config = ProxyConfig(str(config_file))
         assert proxy_config.config_data == sample_config
 
+    def test_load_config_reuses_parsed_file(self, config_file: Path) -> None:
+        """Test an unchanged file is parsed once and an edited one again."""
+        import os
+
+        first = ProxyConfig(str(config_file))
+        second = ProxyConfig(str(config_file))
+        assert second.config_data is first.config_data
+
+        config_file.write_text(json.dumps({"users": ["changed"]}))
+        stat = config_file.stat()
+        os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        reloaded = ProxyConfig(str(config_file))
+        assert reloaded.get_users() == ["changed"]
+
+    def test_load_config_large_file(self, sample_config: dict[str, Any]) -> None:
+        """Test configs above the mmap threshold load the same way."""
+        from src.proxy_config import CONFIG_MMAP_MIN_SIZE
+
+        sample_config["users"] = [f"user{i}" for i in range(20000)]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as f:
+            json.dump(sample_config, f)
+            config_path = Path(f.name)
+
+        try:
+            assert config_path.stat().st_size >= CONFIG_MMAP_MIN_SIZE
+            proxy_config = ProxyConfig(str(config_path))
+            assert proxy_config.config_data == sample_config
+        finally:
+            config_path.unlink()
+
     def test_load_config_file_not_found(self) -> None:
         """Test config loading with non-existent file."""
         with pytest.raises(FileNotFoundError):
@@ -189,6 +220,19 @@ class TestProxyConfig:
                 config["password"] == "testuser:test-password"
             )  # user:password format
 
+    def test_generated_configs_do_not_share_state(self, config_file: Path) -> None:
+        """Test configs built from templates can be mutated independently."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        first = proxy_config._generate_hysteria2_config("a.example.com", "A")
+        second = proxy_config._generate_hysteria2_config("b.example.com", "B")
+        first["alpn"].append("h2")
+        first["udp"] = False
+
+        assert second["alpn"] == ["h3"]
+        assert second["udp"] is True
+        assert second["server"] == "b.example.com"
+
     @patch("src.proxy_config.settings")
     def test_generate_hysteria2_config_with_password(
         self, mock_settings, config_file: Path
@@ -373,6 +417,99 @@ class TestProxyConfig:
         expected_names = ["DE_1_CONTABO", "US_1_VULTR"]
         assert set(proxy_list) == set(expected_names)
 
+    def test_get_proxy_list_skips_config_generation(
+        self, sample_config: dict[str, Any], tmp_path: Path
+    ) -> None:
+        """Test proxy names come from the subscription without building configs."""
+        sample_config["subs"]["default"].update(
+            {
+                "NO_HOST": {"protocol": "hy2"},
+                "BAD_PROTO": {"protocol": "unsupported", "host": "x.example.com"},
+            }
+        )
+        path = tmp_path / "proxy_config.json"
+        path.write_text(json.dumps(sample_config))
+        proxy_config = ProxyConfig(str(path))
+
+        with patch.object(proxy_config, "generate_proxy_configs") as generate:
+            proxy_list = proxy_config.get_proxy_list()
+
+        generate.assert_not_called()
+        assert proxy_list == ["DE_1_CONTABO", "US_1_VULTR"]
+
+    def test_static_configs_built_once(self, config_file: Path) -> None:
+        """Test password-less configs are reused until settings change."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        with patch.object(
+            proxy_config,
+            "_generate_proxy_config",
+            wraps=proxy_config._generate_proxy_config,
+        ) as generate:
+            first = proxy_config.generate_proxy_configs()
+            second = proxy_config.generate_proxy_configs("default")
+            assert generate.call_count == 0
+            assert first == second
+            assert first is not second
+
+            with patch("src.proxy_config.settings.hysteria2_port", 12345):
+                rebuilt = proxy_config.generate_proxy_configs()
+            assert generate.call_count == 2
+
+            proxy_config.generate_proxy_configs(password="pw")
+            assert generate.call_count == 4
+
+        hysteria2 = next(c for c in rebuilt if c["type"] == "hysteria2")
+        assert hysteria2["port"] == 12345
+
+    def test_generate_proxy_configs_returns_copies(self, config_file: Path) -> None:
+        """Test mutating returned configs does not affect later calls."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        first = proxy_config.generate_proxy_configs()
+        for config in first:
+            config["name"] = "mutated"
+            for value in config.values():
+                if isinstance(value, dict | list):
+                    value.clear()
+
+        second = proxy_config.generate_proxy_configs()
+        assert all(config["name"] != "mutated" for config in second)
+        assert any(config.get("alpn") for config in second)
+
+    def test_get_cached_proxy_configs(self, config_file: Path) -> None:
+        """Test placeholder expansions are cached per password."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        with patch.object(
+            proxy_config,
+            "generate_proxy_configs",
+            wraps=proxy_config.generate_proxy_configs,
+        ) as generate:
+            first = proxy_config.get_cached_proxy_configs("default", "pw1", "dimonb")
+            second = proxy_config.get_cached_proxy_configs("default", "pw1", "dimonb")
+            other = proxy_config.get_cached_proxy_configs("default", "pw2", "dimonb")
+
+        assert generate.call_count == 2
+        assert first == second
+        assert first is not second
+        assert other[0]["password"] == "pw2"
+
+    def test_get_cached_proxy_list_expires(self, config_file: Path) -> None:
+        """Test cached proxy lists are rebuilt after the TTL."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        with (
+            patch("src.cache.time.monotonic", side_effect=[0.0, 10.0, 100.0, 100.0]),
+            patch.object(
+                proxy_config, "get_proxy_list", wraps=proxy_config.get_proxy_list
+            ) as get_list,
+        ):
+            for _ in range(3):
+                assert len(proxy_config.get_cached_proxy_list()) == 2
+
+        assert get_list.call_count == 2
+
     def test_get_proxy_list_premium(self, config_file: Path) -> None:
         """Test getting proxy list for premium subscription."""
         proxy_config = ProxyConfig(str(config_file))
@@ -406,6 +543,38 @@ class TestProxyConfig:
         password3 = proxy_config._generate_password("proxy2")
         assert password1 != password3
 
+    def test_derived_credentials_are_stable(self, config_file: Path) -> None:
+        """Test cached credential derivation keeps the published values."""
+        proxy_config = ProxyConfig(str(config_file))
+
+        for _ in range(2):
+            assert proxy_config._generate_password("proxy1") == (
+                "0c41f5b812947c2b28981b4f4817c10bbacd5e48d3175bea962f81892197e8fd"
+            )
+            assert proxy_config._generate_port("proxy1") == 40716
+            assert proxy_config._generate_uuid("proxy1") == (
+                "c4bff63d-3aef-de17-7bca-db492d5a4d87"
+            )
+
+    @patch("src.proxy_config.settings")
+    def test_vless_user_uuid_matches_server(
+        self, mock_settings, config_file: Path
+    ) -> None:
+        """Test the per-user VLESS UUID is sha256(user.salt) in 8-4-4-4-12 form."""
+        import hashlib
+
+        mock_settings.salt = "test-salt"
+        mock_settings.https_port = 443
+        proxy_config = ProxyConfig(str(config_file))
+
+        config = proxy_config._generate_vless_config("h.example.com", "P", "alice")
+
+        hex_val = hashlib.sha256(b"alice.test-salt").hexdigest()
+        assert config["uuid"] == (
+            f"{hex_val[:8]}-{hex_val[8:12]}-{hex_val[12:16]}"
+            f"-{hex_val[16:20]}-{hex_val[20:32]}"
+        )
+
     def test_port_generation_range(self, config_file: Path) -> None:
         """Test that port generation is within expected range."""
         proxy_config = ProxyConfig(str(config_file))
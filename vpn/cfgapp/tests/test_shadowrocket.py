@@ -160,6 +160,24 @@ class TestShadowRocketSubscription:
         password_part = hy2_url.split("hysteria2://")[1].split("@")[0]
         assert password_part == custom_password
 
+    @patch("src.proxy_config.settings")
+    def test_subscription_urls_follow_protocol_not_port(
+        self, mock_settings, config_file: Path
+    ) -> None:
+        """Test a hy2 proxy on the v2 port still gets a plain hy2 URL."""
+        mock_settings.obfs_password = "test-obfs-password"
+        mock_settings.hysteria2_port = 47012
+        mock_settings.hysteria2_v2_port = 47012
+
+        proxy_config = ProxyConfig(str(config_file))
+        subscription_b64 = proxy_config.generate_shadowrocket_subscription(
+            password="pw", user="dimonb"
+        )
+
+        urls = base64.b64decode(subscription_b64).decode().split("\n")
+        hy2_url = next(url for url in urls if url.startswith("hysteria2://"))
+        assert hy2_url.split("hysteria2://")[1].split("@")[0] == "pw"
+
     @patch("src.proxy_config.settings")
     def test_generate_hysteria2_url(self, mock_settings, config_file: Path) -> None:
         """Test Hysteria2 URL generation."""
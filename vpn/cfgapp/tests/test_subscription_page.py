@@ -257,6 +257,21 @@ class TestSubscriptionPage:
         except Exception:
             pytest.fail("QR code should be valid base64 PNG data")
 
+    def test_qr_code_cached_by_data(self, config_file: Path) -> None:
+        """Test repeated QR requests for the same data reuse the encoded image."""
+        from src.proxy_config import ProxyConfig, _qr_code_b64
+
+        proxy_config_instance = ProxyConfig(str(config_file))
+        _qr_code_b64.cache_clear()
+
+        first = proxy_config_instance.generate_qr_code("https://example.com/sr?u=a")
+        second = proxy_config_instance.generate_qr_code("https://example.com/sr?u=a")
+        other = proxy_config_instance.generate_qr_code("https://example.com/sr?u=b")
+
+        assert first == second
+        assert other != first
+        assert _qr_code_b64.cache_info().hits == 1
+
     @patch("src.main.proxy_config")
     @patch("src.config.settings")
     @patch("src.auth.settings")
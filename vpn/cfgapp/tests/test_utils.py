@@ -1,8 +1,11 @@
 """Tests for utils module."""
 
+import pytest
+
 from src.utils import (
     IPProcessor,
     dedupe_lines,
+    extract_query_params,
     ipv4_cover_blocks,
     ipv6_cidr_to_blocks,
     netset_expand,
@@ -38,6 +41,25 @@ class TestIPProcessor:
         assert len(result) == 4
         assert all("/18" in block for block in result)
 
+    def test_ipv4_cover_blocks_top_of_address_space(self) -> None:
+        """Test IPv4 cover blocks stop at 255.255.255.255 instead of wrapping."""
+        processor = IPProcessor(ipv4_block_prefix=18)
+        result = processor.ipv4_cover_blocks("255.0.0.0/8")
+        assert len(result) == 1024
+        assert result[0] == "255.0.0.0/18"
+        assert result[-1] == "255.255.192.0/18"
+
+    def test_cover_blocks_cached_results_are_fresh_lists(self) -> None:
+        """Test cached block expansions cannot be mutated through the API."""
+        processor = IPProcessor(ipv4_block_prefix=18, ipv6_block_prefix=32)
+        first = processor.ipv4_cover_blocks("192.168.1.0/24")
+        first.append("mutated")
+        assert processor.ipv4_cover_blocks("192.168.1.0/24") == ["192.168.0.0/18"]
+
+        first6 = processor.ipv6_cidr_to_blocks("2001:db8::/48")
+        first6.clear()
+        assert processor.ipv6_cidr_to_blocks("2001:db8::/48") == ["2001:db8::/32"]
+
     def test_ipv6_cidr_to_blocks_single_block(self) -> None:
         """Test IPv6 CIDR to blocks when original fits in single target block."""
         processor = IPProcessor(ipv6_block_prefix=32)
@@ -92,6 +114,34 @@ class TestIPProcessor:
         result = processor.netset_expand(text, suffix)
         assert result == ["IP-CIDR,192.168.0.0/18,PROXY,no-resolve"]
 
+    def test_netset_expand_ip_prefix_case_insensitive(self) -> None:
+        """Test lowercase and tab-separated 'ip' prefixes are stripped too."""
+        processor = IPProcessor(ipv4_block_prefix=18)
+        text = "ip\t10.0.0.0/24\nIp 2001:db8::/48"
+        result = processor.netset_expand(text, ",PROXY")
+        assert result == ["IP-CIDR,10.0.0.0/18,PROXY", "IP-CIDR,2001:db8::/32,PROXY"]
+
+    def test_netset_expand_target_prefix_lines(self) -> None:
+        """Test aligned target-prefix lines pass through and others are floored."""
+        processor = IPProcessor(ipv4_block_prefix=18)
+        text = "10.0.64.0/18\n10.0.0.5/18"
+        result = processor.netset_expand(text, ",PROXY")
+        assert result == ["IP-CIDR,10.0.64.0/18,PROXY", "IP-CIDR,10.0.0.0/18,PROXY"]
+
+    def test_netset_expand_skips_malformed_ipv6_quickly(self) -> None:
+        """Test long malformed colon lines are skipped without backtracking."""
+        processor = IPProcessor(ipv6_block_prefix=32)
+        text = "a:" * 40 + "!/32\n2001:db8::1/128\n2001:db8::/48"
+        result = processor.netset_expand(text, ",PROXY")
+        assert result == ["IP-CIDR,2001:db8::/32,PROXY"]
+
+    def test_netset_expand_rejects_invalid_octets(self) -> None:
+        """Test octets ipaddress refuses still raise on the fast parse path."""
+        processor = IPProcessor(ipv4_block_prefix=18)
+        for text in ("10.0.0.256/24", "10.0.0.01/24", "10.0.\u0663.0/18"):
+            with pytest.raises(ValueError):
+                processor.netset_expand(text, ",PROXY")
+
     def test_dedupe_lines(self) -> None:
         """Test line deduplication."""
         processor = IPProcessor()
@@ -106,6 +156,26 @@ class TestIPProcessor:
         result = processor.dedupe_lines(lines)
         assert result == ["c", "a", "b"]
 
+    def test_dedupe_lines_ignores_surrounding_whitespace(self) -> None:
+        """Test lines equal after stripping count as duplicates; blanks go."""
+        processor = IPProcessor()
+        lines = [" a", "a", "", "b ", " a", "b", "  "]
+        result = processor.dedupe_lines(lines)
+        assert result == [" a", "b "]
+
+    def test_ipv4_cover_blocks_caches_narrow_spans_only(self) -> None:
+        """Test wide spans are not kept in the block cache."""
+        from src.utils import _cached_ipv4_span_blocks
+
+        processor = IPProcessor(ipv4_block_prefix=18)
+        _cached_ipv4_span_blocks.cache_clear()
+
+        assert len(processor.ipv4_cover_blocks("10.0.0.0/8")) == 1024
+        assert _cached_ipv4_span_blocks.cache_info().currsize == 0
+
+        assert len(processor.ipv4_cover_blocks("10.0.0.0/12")) == 64
+        assert _cached_ipv4_span_blocks.cache_info().currsize == 1
+
 
 class TestConvenienceFunctions:
     """Test convenience functions."""
@@ -132,3 +202,25 @@ class TestConvenienceFunctions:
         suffix = ",PROXY"
         result = netset_expand(text, suffix, 18)
         assert result == ["IP-CIDR,192.168.0.0/18,PROXY"]
+
+
+class TestExtractQueryParams:
+    """Test extract_query_params function."""
+
+    def test_extract_query_params_selected_keys(self) -> None:
+        """Test only requested keys are extracted and decoded."""
+        result = extract_query_params(
+            "u=test%20user&hash=abc&sub=v2&json=true", frozenset(("u", "hash"))
+        )
+        assert result == {"u": "test user", "hash": "abc"}
+
+    def test_extract_query_params_matches_parse_qs(self) -> None:
+        """Test first value wins and blank values are dropped like parse_qs."""
+        result = extract_query_params(
+            "u=&hash=first&hash=second&sub", frozenset(("u", "hash", "sub"))
+        )
+        assert result == {"hash": "first"}
+
+    def test_extract_query_params_empty(self) -> None:
+        """Test empty query string."""
+        assert extract_query_params("", frozenset(("u",))) == {}